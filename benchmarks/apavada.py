@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.apavada
+    ~~~~~~~~~~~~~~~~~~
+
+    Measures how utsarga-apavāda inference scales with the number of
+    rules. Synthetic rules are made by recombining the windows,
+    operators, and loci of the real rules.
+
+    Run from the repository root::
+
+        python -m benchmarks.apavada
+
+    :license: MIT and BSD
+"""
+
+import itertools
+import random
+import sys
+import time
+from collections import defaultdict
+
+from vyakarana import expand, trees
+from vyakarana.rules import Rule
+from vyakarana.templates import Na, Shesha
+
+SIZES = [250, 500, 1000, 2000, 4000]
+
+#: The naive search is skipped for larger rule sets.
+NAIVE_LIMIT = 2000
+
+
+def naive_apavada_rules(rules):
+    """The original quadratic search, kept as a reference."""
+    apavadas = defaultdict(set)
+    for i, rule in enumerate(rules):
+        if rule.modifier == Na:
+            for other in rules:
+                if (rule.operator == other.operator and rule != other):
+                    apavadas[other].add(rule)
+        else:
+            if rule.modifier == Shesha:
+                rule_slice = itertools.islice(rules, 0, i)
+            else:
+                rule_slice = itertools.islice(rules, i, None)
+            new_apavadas = (r for r in rule_slice if rule.has_apavada(r))
+            apavadas[rule].update(new_apavadas)
+    return apavadas
+
+
+def synthetic_rules(n, seed=0):
+    """Create `n` rules by recombining parts of the real rules.
+
+    :param n: the number of rules to create
+    :param seed: the random seed
+    """
+    base = expand.build_from_stubs()
+    rng = random.Random(seed)
+    rules = []
+    for i in range(n):
+        a, b = rng.choice(base), rng.choice(base)
+        window = [list(x) for x in a.window]
+        rule = Rule('x.%d' % i, window, b.operator, modifier=a.modifier,
+                    category=a.category, locus=b.locus,
+                    optional=a.optional)
+        rules.append(rule)
+    return rules
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return time.time() - start, result
+
+
+def main():
+    print '%8s  %10s  %10s  %8s' % ('rules', 'naive (s)', 'index (s)',
+                                    'speedup')
+    for n in SIZES:
+        rules = synthetic_rules(n)
+        index_time, indexed = timed(trees.find_apavada_rules, rules)
+        if n <= NAIVE_LIMIT:
+            naive_time, naive = timed(naive_apavada_rules, rules)
+            assert naive == indexed
+            print '%8d  %10.3f  %10.3f  %7.1fx' % (
+                n, naive_time, index_time, naive_time / index_time)
+        else:
+            print '%8d  %10s  %10.3f  %8s' % (n, '-', index_time, '-')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
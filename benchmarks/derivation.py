@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.derivation
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Measures derivation speed in a set of reproducible scenarios:
+
+    - ``cold``: constructing an :class:`~vyakarana.ashtadhyayi.Ashtadhyayi`
+      from the saved rule tree
+    - ``cold_build``: constructing one without the saved rule tree
+    - ``subset``: constructing one with
+      :meth:`~vyakarana.ashtadhyayi.Ashtadhyayi.with_rules_in`
+    - ``single``: deriving the same form over and over
+    - ``paradigm:<la>``: deriving full paradigms for a sample of roots
+    - ``sweep``: deriving one form for every root in the Dhātupāṭha
+    - ``finish``: the sandhi and asiddha stage on its own
+
+    Each scenario is a list of timed operations. For each scenario we
+    report operations per second, p50 and p99 latency, and the peak
+    memory of the process so far.
+
+    Run from the repository root::
+
+        python -m benchmarks.derivation
+        python -m benchmarks.derivation --quick single paradigm:la~w
+        python -m benchmarks.derivation --save baseline.json
+        python -m benchmarks.derivation --baseline baseline.json
+
+    With ``--baseline``, each scenario is compared against the stored
+    results, and the script exits with status 1 if any scenario is
+    slower than the baseline by more than ``--tolerance``.
+
+    :license: MIT and BSD
+"""
+
+import argparse
+import json
+import logging
+import random
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from vyakarana.ashtadhyayi import Ashtadhyayi
+from vyakarana.build import build_rule_tree
+from vyakarana.dhatupatha import DHATUPATHA
+from vyakarana.lists import PURUSHA, VACANA
+from vyakarana.terms import Upadesha, Vibhakti
+
+#: Bump this whenever the format of the saved results changes.
+RESULTS_VERSION = 1
+
+#: The lakāras used for the paradigm scenarios.
+LAS = ['la~w', 'li~w', 'lf~w']
+
+#: Rule ranges used for the ``subset`` scenario.
+SUBSETS = [
+    ('1.1.47', '3.4.82'),
+    ('6.1.8', '6.4.126'),
+    ('7.1.3', '7.4.73'),
+    ('1.1.47', '7.4.73'),
+]
+
+#: The form derived by the ``single`` scenario.
+SINGLE = ('BU', 'la~w', 'prathama', 'ekavacana')
+
+#: Maps a scenario name to the function that runs it.
+SCENARIOS = OrderedDict()
+
+
+def scenario(name):
+    """Decorator that registers a scenario.
+
+    A scenario function accepts the parsed command line options and
+    returns a list of timings, one for each operation, in seconds.
+
+    :param name: the scenario name
+    """
+    def decorator(fn):
+        SCENARIOS[name] = fn
+        return fn
+    return decorator
+
+
+def timed(fn, *args):
+    """Return the time it takes to call `fn`, in seconds."""
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+
+_ashtadhyayi = None
+
+
+def shared_ashtadhyayi():
+    """Return an uncached :class:`Ashtadhyayi` shared by all scenarios.
+
+    The result cache is disabled so that repeated derivations do real
+    work.
+    """
+    global _ashtadhyayi
+    if _ashtadhyayi is None:
+        _ashtadhyayi = Ashtadhyayi(cache_size=0)
+    return _ashtadhyayi
+
+
+def sample_dhatus(n, seed=0):
+    """Return a fixed random sample of `n` roots from the Dhātupāṭha.
+
+    :param n: the sample size
+    :param seed: the random seed
+    """
+    dhatus = sorted(set(DHATUPATHA.all_dhatu))
+    return random.Random(seed).sample(dhatus, min(n, len(dhatus)))
+
+
+def derive_form(a, dhatu, la, purusha, vacana):
+    """Derive a single form and ignore any errors.
+
+    Some roots aren't supported yet, and a failed derivation still
+    costs time, so it's timed like any other.
+    """
+    try:
+        d = Upadesha.as_dhatu(dhatu)
+        p = Vibhakti(la).add_samjna(purusha, vacana)
+        return list(a.derive([d, p]))
+    except Exception:
+        return None
+
+
+def derive_paradigm(a, dhatu, la):
+    """Derive a full paradigm and ignore any errors."""
+    try:
+        return a.derive_paradigm(dhatu, la)
+    except Exception:
+        return None
+
+
+@scenario('cold')
+def run_cold(options):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = build_rule_tree(os.path.join(tmp_dir, 'rule_tree.pickle'))
+        return [timed(Ashtadhyayi, None, 0, path)
+                for i in range(options.repeat)]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@scenario('cold_build')
+def run_cold_build(options):
+    return [timed(Ashtadhyayi, None, 0)]
+
+
+@scenario('subset')
+def run_subset(options):
+    return [timed(Ashtadhyayi.with_rules_in, start, end)
+            for start, end in SUBSETS]
+
+
+@scenario('single')
+def run_single(options):
+    a = shared_ashtadhyayi()
+    n = 20 if options.quick else 200
+    return [timed(derive_form, a, *SINGLE) for i in range(n)]
+
+
+def make_paradigm_scenario(la):
+    def run_paradigm(options):
+        a = shared_ashtadhyayi()
+        dhatus = sample_dhatus(10 if options.quick else 100)
+        return [timed(derive_paradigm, a, d, la) for d in dhatus]
+    return run_paradigm
+
+for _la in LAS:
+    scenario('paradigm:%s' % _la)(make_paradigm_scenario(_la))
+
+
+@scenario('sweep')
+def run_sweep(options):
+    a = shared_ashtadhyayi()
+    dhatus = DHATUPATHA.all_dhatu
+    if options.quick:
+        dhatus = dhatus[::20]
+    return [timed(derive_form, a, d, 'la~w', 'prathama', 'ekavacana')
+            for d in dhatus]
+
+
+class _FinishRecorder(Ashtadhyayi):
+
+    """Records every state that reaches the sandhi and asiddha stage."""
+
+    def _sandhi_asiddha(self, state):
+        self.finished.append(state)
+        return Ashtadhyayi._sandhi_asiddha(self, state)
+
+
+@scenario('finish')
+def run_finish(options):
+    a = _FinishRecorder(cache_size=0)
+    a.finished = []
+    for d in sample_dhatus(5 if options.quick else 30):
+        for la in LAS:
+            for purusha in PURUSHA:
+                for vacana in VACANA:
+                    derive_form(a, d, la, purusha, vacana)
+
+    finish = lambda s: list(Ashtadhyayi._sandhi_asiddha(a, s))
+    return [timed(finish, s) for s in a.finished]
+
+
+def percentile(values, q):
+    """Return the `q`-th percentile of a sorted list.
+
+    :param values: a sorted list of numbers
+    :param q: a number from 0 to 100
+    """
+    if not values:
+        return 0.0
+    index = int(round(q / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def peak_memory():
+    """Return the peak resident set size of this process, in KB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def summarize(timings):
+    """Return a `dict` of summary statistics for a list of timings.
+
+    :param timings: a list of timings, in seconds
+    """
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'ops': len(timings),
+        'ops_per_sec': len(timings) / total if total else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'peak_kb': peak_memory(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compare `results` against `baseline` and return the regressions.
+
+    :param results: maps a scenario name to its summary
+    :param baseline: the same, from an earlier run
+    :param tolerance: the largest allowed fractional slowdown
+    :returns: a list of scenario names that got slower
+    """
+    print
+    print '%-16s %12s %12s %8s' % ('scenario', 'base ops/s', 'ops/s',
+                                   'change')
+    regressions = []
+    for name, summary in results.iteritems():
+        old = baseline.get(name)
+        if not old or not old['ops_per_sec']:
+            print '%-16s %12s %12.1f %8s' % (name, '-',
+                                             summary['ops_per_sec'], '-')
+            continue
+
+        change = summary['ops_per_sec'] / old['ops_per_sec'] - 1
+        flag = ''
+        if change < -tolerance:
+            regressions.append(name)
+            flag = '  SLOWER'
+        print '%-16s %12.1f %12.1f %+7.1f%%%s' % (
+            name, old['ops_per_sec'], summary['ops_per_sec'],
+            change * 100, flag)
+    return regressions
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Measure derivation performance.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='scenarios to run (default: all). Choices: '
+                             + ', '.join(SCENARIOS))
+    parser.add_argument('--quick', action='store_true',
+                        help='use smaller inputs')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of constructions for "cold"')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as JSON')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown against the baseline')
+    options = parser.parse_args(args)
+
+    for name in options.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: %s' % name)
+    return options
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    logging.getLogger('vyakarana').setLevel(logging.CRITICAL)
+
+    names = options.scenarios or list(SCENARIOS)
+    results = OrderedDict()
+    print '%-16s %6s %10s %10s %10s %10s' % ('scenario', 'ops', 'ops/s',
+                                             'p50 (ms)', 'p99 (ms)',
+                                             'peak (MB)')
+    for name in names:
+        summary = results[name] = summarize(SCENARIOS[name](options))
+        print '%-16s %6d %10.1f %10.2f %10.2f %10.1f' % (
+            name, summary['ops'], summary['ops_per_sec'],
+            summary['p50_ms'], summary['p99_ms'],
+            summary['peak_kb'] / 1024.0)
+        sys.stdout.flush()
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'version': RESULTS_VERSION, 'results': results}, f,
+                      indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            data = json.load(f)
+        if data.get('version') != RESULTS_VERSION:
+            sys.exit('%s: unsupported version' % options.baseline)
+        if compare(results, data['results'], options.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
+import logging
+
 import pytest
 
-from vyakarana.ashtadhyayi import Ashtadhyayi
+from vyakarana.ashtadhyayi import Ashtadhyayi, DerivationLimitError
+from vyakarana.lists import PURUSHA, VACANA
 from vyakarana.terms import Upadesha, Vibhakti
+from vyakarana.tracing import Collector, LogTrace
 
 
 @pytest.fixture(scope='session')
@@ -23,3 +27,238 @@ def test_derive(ashtadhyayi):
     la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
     items = [dhatu, la]
     assert 'Bavati' in ashtadhyayi.derive(items)
+
+
+def test_derive_cache():
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=2)
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+
+    first = list(a.derive([dhatu, la]))
+    assert a.cache.misses == 1
+    assert a.cache.hits == 0
+
+    second = list(a.derive([dhatu, la]))
+    assert first == second
+    assert a.cache.hits == 1
+
+    a.cache.clear()
+    assert not a.cache
+    assert a.cache.hits == a.cache.misses == 0
+
+
+def test_derive_no_cache():
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=0)
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+    assert list(a.derive([dhatu, la])) == list(a.derive([dhatu, la]))
+    assert not a.cache
+
+
+@pytest.mark.parametrize('la', ['la~w', 'li~w'])
+def test_derive_paradigm(ashtadhyayi, la):
+    table = ashtadhyayi.derive_paradigm('BU', la, pada='parasmaipada')
+    assert len(table) == 3
+    for i, purusha in enumerate(PURUSHA):
+        assert len(table[i]) == 3
+        for j, vacana in enumerate(VACANA):
+            dhatu = Upadesha.as_dhatu('BU')
+            p = Vibhakti(la).add_samjna(purusha, vacana)
+            assert table[i][j] == set(ashtadhyayi.derive([dhatu, p]))
+
+
+def test_derive_paradigm_both_padas(ashtadhyayi):
+    tables = ashtadhyayi.derive_paradigm('ya\\ja~^', 'la~w')
+    assert set(tables) == set(['parasmaipada', 'atmanepada'])
+    assert tables['parasmaipada'][0][0] == set(['yajati'])
+    assert tables['atmanepada'][0][0] == set(['yajate'])
+
+
+def test_init_compiled(tmpdir):
+    path = str(tmpdir.join('tree.pickle'))
+    a = Ashtadhyayi(tree_file=path)
+    assert tmpdir.join('tree.pickle').check()
+
+    b = Ashtadhyayi(tree_file=path)
+    assert ([r.name for r in a.rule_tree.ranked_rules] ==
+            [r.name for r in b.rule_tree.ranked_rules])
+    assert len(a.rule_tree) == len(b.rule_tree)
+
+
+def test_derive_dedup():
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=0)
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+
+    # Two branches that converge on the same state.
+    def next_rule(state, trace=None):
+        if len(state[0].value) < 3:
+            new = state.swap(0, state[0].set_value(state[0].value + 'a'))
+            return None, 0, [new, new.copy()]
+    a._next_rule = next_rule
+    assert len(list(a.derive([dhatu, la]))) == 1
+
+
+@pytest.mark.parametrize('limit', ['max_states', 'max_depth'])
+def test_derive_limits(limit):
+    a = Ashtadhyayi(cache_size=0, **{limit: 3})
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+    with pytest.raises(DerivationLimitError) as e:
+        list(a.derive([dhatu, la]))
+    assert e.value.limit == limit
+    assert e.value.value == 3
+    assert e.value.path is None
+
+    with pytest.raises(DerivationLimitError) as e:
+        list(a.derive([dhatu, la], provenance=True))
+    states = a.replay([dhatu, la], e.value.path)
+    assert states[-1] == e.value.state
+
+    a = Ashtadhyayi(cache_size=0, max_states=None, max_depth=None)
+    assert 'Bavati' in a.derive([dhatu, la])
+
+
+def test_derive_paradigm_loop():
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=0)
+
+    # A rule that undoes itself.
+    def shared_rule(state):
+        value = 'Bo' if state[0].value == 'BU' else 'BU'
+        return [state.swap(0, state[0].set_value(value))]
+    a._apply_shared_rule = shared_rule
+    with pytest.raises(DerivationLimitError) as e:
+        a.derive_paradigm('BU', 'la~w')
+    assert e.value.limit == 'cycle'
+    assert e.value.value is None
+    assert e.value.state[0].value == 'Bo'
+
+
+def test_derive_cycle():
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=0)
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+
+    # A rule that undoes itself.
+    def next_rule(state, trace=None):
+        value = 'Bo' if state[0].value == 'BU' else 'BU'
+        return None, 0, [state.swap(0, state[0].set_value(value))]
+    a._next_rule = next_rule
+    with pytest.raises(DerivationLimitError) as e:
+        list(a.derive([dhatu, la]))
+    assert e.value.limit == 'cycle'
+    assert e.value.state[0].value == 'Bo'
+
+
+@pytest.mark.parametrize('limit', ['max_states', 'max_depth'])
+def test_derive_paradigm_limits(limit):
+    a = Ashtadhyayi.with_rules_in('3.1.68', '3.1.82', cache_size=0,
+                                  **{limit: 3})
+
+    # A rule that never stops applying.
+    def shared_rule(state):
+        new = state.swap(0, state[0].set_value(state[0].value + 'a'))
+        return [new, new.swap(0, new[0].set_value(new[0].value + 'b'))]
+    a._apply_shared_rule = shared_rule
+    with pytest.raises(DerivationLimitError) as e:
+        a.derive_paradigm('BU', 'la~w')
+    assert e.value.limit == limit
+    assert e.value.value == 3
+
+
+def test_derive_iter(ashtadhyayi):
+    dhatu = Upadesha.as_dhatu('ci\\Y')
+    la = Vibhakti('li~w').add_samjna('prathama', 'ekavacana')
+    items = [dhatu, la]
+
+    # 7.3.58 is a vibhASA rule, so the declined option is preferred.
+    preferred = list(ashtadhyayi.derive_iter(items))
+    assert preferred[0] == 'cicye'
+    assert sorted(preferred) == sorted(set(ashtadhyayi.derive(items)))
+
+    default = list(ashtadhyayi.derive_iter(items, order='default'))
+    assert default == list(ashtadhyayi.derive(items))
+
+    assert list(ashtadhyayi.derive_iter(items, limit=1)) == ['cicye']
+    assert list(ashtadhyayi.derive_iter(items, limit=0)) == []
+    with pytest.raises(ValueError):
+        list(ashtadhyayi.derive_iter(items, order='random'))
+
+
+def test_derive_iter_distinct(ashtadhyayi):
+    dhatu = Upadesha.as_dhatu('SF')
+    la = Vibhakti('li~w').add_samjna('prathama', 'ekavacana')
+    assert list(ashtadhyayi.derive_iter([dhatu, la])) == ['SaSAra']
+
+
+def test_derive_iter_stops_early():
+    trace = Collector()
+    a = Ashtadhyayi(trace=trace)
+    dhatu = Upadesha.as_dhatu('ci\\Y')
+    la = Vibhakti('li~w').add_samjna('prathama', 'ekavacana')
+
+    list(a.derive_iter([dhatu, la]))
+    total = len(trace.rules())
+    trace.clear()
+    list(a.derive_iter([dhatu, la], limit=1))
+    assert len(trace.rules()) < total
+
+
+def test_derive_provenance():
+    a = Ashtadhyayi(cache_size=0)
+    dhatu = Upadesha.as_dhatu('ci\\Y')
+    la = Vibhakti('li~w').add_samjna('prathama', 'ekavacana')
+
+    results = list(a.derive([dhatu, la], provenance=True))
+    assert [r.result for r in results] == list(a.derive([dhatu, la]))
+
+    for result, path in results:
+        assert all(isinstance(x, int) for item in path for x in item)
+        states = a.replay([dhatu, la], path)
+        assert len(states) == len(path) + 1
+        assert result in a._sandhi_asiddha(states[-1])
+
+        rules = a.rule_tree.ranked_rules
+        assert states[-1].history == tuple((rules[r], i)
+                                           for r, i, b in path)
+
+
+def test_derive_no_history():
+    trace = Collector()
+    a = Ashtadhyayi(trace=trace)
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+    list(a.derive([dhatu, la]))
+    final = [e[1] for e in trace.events if e[0] == 'yield'][0]
+    assert not final.tracks_history
+    assert final.history == ()
+
+
+def test_derive_trace():
+    a = Ashtadhyayi()
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+
+    # Per call
+    trace = Collector()
+    results = list(a.derive([dhatu, la], trace=trace))
+    events = [e[0] for e in trace.events]
+    assert events[0] == 'start'
+    assert events.count('yield') == len(results)
+    assert '3.1.68' in trace.rules()
+
+    # Per instance, even on a cache hit
+    rules = trace.rules()
+    a.trace = trace
+    trace.clear()
+    assert list(a.derive([dhatu, la])) == results
+    assert trace.rules() == rules
+
+
+def test_log_trace(caplog):
+    a = Ashtadhyayi(trace=LogTrace())
+    dhatu = Upadesha.as_dhatu('BU')
+    la = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+    with caplog.at_level(logging.DEBUG, logger='vyakarana'):
+        list(a.derive([dhatu, la]))
+    assert any('3.1.68' in r.getMessage() for r in caplog.records)
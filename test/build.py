@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+    test.build
+    ~~~~~~~~~~
+
+    Tests for writing precomputed data files.
+
+    :license: MIT and BSD
+"""
+
+from vyakarana import build
+from vyakarana.ashtadhyayi import Ashtadhyayi
+from vyakarana.dhatupatha import Dhatupatha, DHATUPATHA, DHATUPATHA_CSV
+from vyakarana.expand import build_from_stubs
+from vyakarana.trees import RuleTree
+
+
+def test_build_dhatupatha(tmpdir):
+    path = str(tmpdir.join('dhatupatha.index'))
+    assert build.build_dhatupatha(path) == path
+    loaded = Dhatupatha.load(path, DHATUPATHA_CSV)
+    assert loaded.all_dhatu == DHATUPATHA.all_dhatu
+
+
+def test_build_rule_tree(tmpdir):
+    path = str(tmpdir.join('rule_tree.pickle'))
+    assert build.build_rule_tree(path) == path
+    assert RuleTree.load(path, build_from_stubs())
+
+    a = Ashtadhyayi(tree_file=path)
+    assert ([r.name for r in a.rule_tree.ranked_rules] ==
+            [r.name for r in Ashtadhyayi().rule_tree.ranked_rules])
+
+
+def test_main(tmpdir, capsys):
+    index = tmpdir.join('dhatupatha.index')
+    tree = tmpdir.join('rule_tree.pickle')
+    build.main(['--dhatupatha-index', str(index), '--rule-tree', str(tree)])
+    assert index.check()
+    assert tree.check()
+    out = capsys.readouterr()[0]
+    assert str(index) in out
+    assert str(tree) in out
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+    test.bulk
+    ~~~~~~~~~
+
+    Tests for bulk derivation.
+
+    :license: MIT and BSD
+"""
+
+import pytest
+
+from vyakarana import bulk
+
+
+INPUTS = [
+    ('BU', 'la~w', 'prathama', 'ekavacana'),
+    ('camA^m', 'li~w', 'prathama', 'ekavacana'),
+    ('BU', 'li~w', 'prathama', 'ekavacana'),
+]
+
+
+def test_all_inputs():
+    inputs = list(bulk.all_inputs(las=['la~w', 'li~w'], dhatus=['BU']))
+    assert len(inputs) == 18
+    assert inputs[0] == ('BU', 'la~w', 'prathama', 'ekavacana')
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_derive_many(processes):
+    results = list(bulk.derive_many(INPUTS, processes=processes,
+                                    chunksize=1))
+    assert [r.input for r in results] == INPUTS
+
+    assert results[0].forms == ['Bavati']
+    assert results[0].error is None
+
+    # Failures are reported, not raised.
+    assert results[1].forms is None
+    assert results[1].error
+
+    assert results[2].forms == ['baBUva']
+
+
+def test_derive_many_unordered():
+    results = list(bulk.derive_many(INPUTS, processes=2, ordered=False))
+    assert sorted(r.input for r in results) == sorted(INPUTS)
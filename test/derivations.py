@@ -8,18 +8,70 @@
     :license: MIT and BSD
 """
 
+import pytest
+
 from vyakarana.derivations import State
+from vyakarana.terms import Upadesha
 
 
 class TestState(object):
 
     def test_init_no_args(self):
         s = State()
-        assert s.terms == []
-        assert s.history == []
+        assert s.terms == ()
+        assert s.history == ()
 
     def test_init_with_terms(self):
         items = list('abc')
         s = State(items)
-        assert s.terms == items
-        assert s.history == []
+        assert s.terms == tuple(items)
+        assert s.history == ()
+
+    def test_copy_shares_selections(self):
+        s = State(list('abc'))
+        assert s.selections == {}
+        assert s.swap(0, 'd').selections is s.selections
+
+    def test_history(self):
+        s = State([Upadesha('a'), Upadesha('b')])
+        s1 = s.mark_rule('r1', 0)
+        s2 = s1.mark_rule('r2', 1)
+        assert s.history == ()
+        assert s1.history == (('r1', 0),)
+        assert s2.history == (('r1', 0), ('r2', 1))
+        assert 'r2' in s2[1].ops
+
+        s3 = State(s2.terms, s2.history)
+        assert s3.history == s2.history
+
+    def test_no_history(self):
+        s = State([Upadesha('a'), Upadesha('b')], track_history=False)
+        s2 = s.mark_rule('r1', 0).mark_rule('r2', 1)
+        assert not s2.tracks_history
+        assert s2.history == ()
+        assert 'r2' in s2[1].ops
+
+    def test_read_only(self):
+        s = State([Upadesha('a')]).mark_rule('r1', 0)
+        with pytest.raises(TypeError):
+            s.terms[0] = 'd'
+        with pytest.raises(AttributeError):
+            s.history.append(('r2', 1))
+
+    def test_hash(self):
+        s = State([Upadesha('a'), Upadesha('b')])
+        t = State([Upadesha('a'), Upadesha('b')])
+        assert s == t
+        assert hash(s) == hash(t)
+        assert len(set([s, t, s.swap(0, Upadesha('c'))])) == 2
+
+    def test_edit(self):
+        s = State(list('abc'))
+        assert s.swap(1, 'x').terms == tuple('axc')
+        assert s.swap(-1, 'x').terms == tuple('abx')
+        assert s.insert(1, 'x').terms == tuple('axbc')
+        assert s.remove(0).terms == tuple('bc')
+        assert s.replace_all('de').terms == tuple('de')
+        assert s.terms == tuple('abc')
+        with pytest.raises(IndexError):
+            s.swap(3, 'x')
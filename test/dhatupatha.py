@@ -30,3 +30,42 @@ def test_dhatu_list():
     for start, end, expected_len in cases:
         results = d.dhatu_list(start, end)
         assert len(results) == expected_len
+
+
+def test_gana_ranges():
+    d = D.Dhatupatha(D.DHATUPATHA_CSV)
+    start, end = d.gana_ranges['1']
+    assert d.all_dhatu[start] == 'BU'
+    assert set(d.gana_map[start:end]) == set(['1'])
+    assert d.gana_map[end] != '1'
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('dhatupatha.index'))
+    d = D.Dhatupatha(D.DHATUPATHA_CSV)
+    d.save(path, D.DHATUPATHA_CSV)
+
+    loaded = D.Dhatupatha.load(path, D.DHATUPATHA_CSV)
+    assert loaded.all_dhatu == d.all_dhatu
+    assert loaded.gana_ranges == d.gana_ranges
+    assert loaded.dhatu_list('ya\\ja~^') == d.dhatu_list('ya\\ja~^')
+
+
+def test_load_out_of_date(tmpdir):
+    csv = tmpdir.join('dhatupatha.csv')
+    csv.write('1,1,BU\n')
+    path = str(tmpdir.join('dhatupatha.index'))
+
+    d = D.Dhatupatha.cached(str(csv), path)
+    assert d.all_dhatu == ['BU']
+    assert D.Dhatupatha.load(path, str(csv)).all_dhatu == ['BU']
+
+    csv.write('1,1,BU\n1,2,eDa~\\\n')
+    assert D.Dhatupatha.load(path, str(csv)) is None
+
+    # Same size, different contents
+    csv.write('1,1,BU\n')
+    D.Dhatupatha.cached(str(csv), path)
+    csv.write('1,1,qU\n')
+    assert D.Dhatupatha.load(path, str(csv)) is None
+    assert D.Dhatupatha.load(str(tmpdir.join('missing')), str(csv)) is None
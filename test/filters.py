@@ -1,6 +1,6 @@
 import vyakarana.filters as F
 import vyakarana.lists as L
-from vyakarana.terms import Upadesha, Pratyaya
+from vyakarana.terms import TAGS, Upadesha, Pratyaya
 from vyakarana.dhatupatha import DHATUPATHA as DP
 
 
@@ -265,6 +265,56 @@ def test_not_():
     verify(cases, lambda x: ~F.al(x), term_tester)
 
 
+def test_compile():
+    filters = [
+        F.upadha('Yam') & F.al('hal'),
+        F.upadha('Yam') | F.al('hal') | F.samjna('kit'),
+        ~(F.al('ac') | F.raw('vu~k')) & F.samyoga,
+        F.auto('dhatu', 'kit', 'Nit', 'ac'),
+    ]
+    terms = [Upadesha('vu~k'), Upadesha.as_dhatu('banD'),
+             Pratyaya('kta'), Upadesha('agni')]
+    for f in filters:
+        predicate = f.compile()
+        assert f.compile() is predicate
+        for t in terms:
+            assert bool(predicate(t)) == bool(f.body(t))
+
+
+def test_compile_merges_leaves():
+    f = F.samjna('kit') | F.samjna('Nit') | F.samjna('dhatu')
+    compiler = F._FilterCompiler()
+    assert compiler.expr(f) == (1, '(term.samjna.mask & _c0)')
+    assert compiler.namespace['_c0'] == TAGS.mask(['kit', 'Nit', 'dhatu'])
+
+
+# Result cache
+# ~~~~~~~~~~~~
+
+def test_fields():
+    assert F.al('hal').fields() == ('value',)
+    assert F.Sit_adi.fields() == ('raw',)
+    assert F.samyoga.fields() == ('value',)
+    assert F.AlFilter.no_params(lambda term: True).fields() is None
+    assert (F.al('hal') & ~F.samjna('kit')).fields() == ('samjna', 'value')
+    assert (F.al('hal') | F.term_placeholder).fields() is None
+
+
+def test_shared_results():
+    f = F.al('hal') & F.samjna('kit')
+    term = Upadesha('vu~k').set_value('vak')
+    assert f.allows([term], 0)
+
+    # A change to an unread field reuses the old result.
+    hits = F.TermFilter.RESULTS.hits
+    assert f.allows([term.add_op('rule')], 0)
+    assert F.TermFilter.RESULTS.hits == hits + 1
+
+    # A change to a read field doesn't.
+    assert not f.allows([term.set_value('vaka')], 0)
+    assert F.TermFilter.RESULTS.hits == hits + 1
+
+
 # Filter operators
 # ~~~~~~~~~~~~~~~~
 
@@ -132,3 +132,64 @@ def test_vrddhi():
         ('sad', 'sad'),  # iko guNavRddhI
     ]
     verify(cases, O.vrddhi)
+
+
+def test_guna_value():
+    assert O.guna_value('mid') == 'med'
+    assert O.guna_value('kf') == 'kar'
+    assert O.guna_value('sad') == 'sad'
+    assert O.guna_value('') == ''
+
+
+def test_vrddhi_value():
+    assert O.vrddhi_value('ji') == 'jE'
+    assert O.vrddhi_value('kf') == 'kAr'
+    assert O.vrddhi_value('sad') == 'sad'
+
+
+def test_al_tasya():
+    cases = [
+        ('kf', 'kar'),
+        ('ji', 'ja'),
+    ]
+    verify(cases, O.al_tasya('ik', 'at'))
+
+
+def test_data_operator_memo_disabled():
+    O.DataOperator.disable_memo()
+    verify([('J', 'ant')], O.replace('J', 'ant'))
+    assert O.DataOperator.MEMO is None
+
+
+def test_data_operator_memo():
+    O.DataOperator.enable_memo(max_size=2)
+    try:
+        op = O.replace('J', 'ant')
+        verify([('J', 'ant'), ('J', 'ant'), ('aJ', 'aant')], op)
+        assert O.DataOperator.MEMO.get((op.name, 'J')) == 'ant'
+
+        stats = O.DataOperator.memo_stats()
+        assert stats['size'] == 2
+        assert stats['operators'][op.name] == {
+            'calls': 3,
+            'hits': 1,
+            'hit_rate': 1.0 / 3,
+        }
+
+        # Bounded
+        verify([('Ja', 'anta')], op)
+        assert len(O.DataOperator.MEMO) == 2
+    finally:
+        O.DataOperator.disable_memo()
+
+
+def test_data_operator_memo_impure():
+    O.DataOperator.enable_memo()
+    try:
+        op = O.replace('J', 'ant')
+        op.pure = False
+        verify([('J', 'ant'), ('J', 'ant')], op)
+        assert len(O.DataOperator.MEMO) == 0
+        assert O.DataOperator.memo_stats()['operators'][op.name]['calls'] == 2
+    finally:
+        O.DataOperator.disable_memo()
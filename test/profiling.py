@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+    test.profiling
+    ~~~~~~~~~~~~~~
+
+    Tests for per-rule and per-filter profiling.
+
+    :license: MIT and BSD
+"""
+
+import json
+
+import pytest
+
+from vyakarana.ashtadhyayi import Ashtadhyayi
+from vyakarana.filters import TermFilter
+from vyakarana.profiling import Profiler
+from vyakarana.rules import Rule
+from vyakarana.terms import Upadesha, Vibhakti
+
+
+def derive(a):
+    d = Upadesha.as_dhatu('BU')
+    p = Vibhakti('la~w').add_samjna('prathama', 'ekavacana')
+    return list(a.derive([d, p]))
+
+
+def test_enable_and_disable():
+    apply = Rule.__dict__['apply']
+    allows = TermFilter.__dict__['allows']
+
+    profiler = Profiler()
+    with profiler:
+        assert profiler.enabled
+        assert Rule.__dict__['apply'] is not apply
+        with pytest.raises(RuntimeError):
+            Profiler().enable()
+
+    assert not profiler.enabled
+    assert Rule.__dict__['apply'] is apply
+    assert TermFilter.__dict__['allows'] is allows
+
+
+def test_stats():
+    with Ashtadhyayi(cache_size=0, profile=True) as a:
+        assert derive(a) == ['Bavati']
+    assert not a.profiler.enabled
+
+    stats = a.stats()
+    for name, c in stats.rules.iteritems():
+        assert c['candidate'] >= c['tried']
+        assert c['tried'] == c['produced'] + c['noop']
+    assert stats.rules['3.1.68']['produced'] == 1
+    assert stats.filters
+    assert stats.select['calls'] > 0
+
+    # Nothing is counted once disabled.
+    derive(a)
+    assert a.stats().rules == stats.rules
+
+
+def test_profile_in_sequence():
+    first = Ashtadhyayi(cache_size=0, profile=True)
+    derive(first)
+    first.close()
+
+    with Ashtadhyayi(cache_size=0, profile=True) as second:
+        derive(second)
+    for a in (first, second):
+        assert a.stats().rules['3.1.68']['produced'] == 1
+
+
+def test_report_and_json():
+    with Profiler() as profiler:
+        derive(Ashtadhyayi(cache_size=0))
+
+    stats = profiler.stats()
+    assert '3.1.68' in stats.report(limit=None)
+    assert json.loads(stats.to_json()) == json.loads(
+        json.dumps(stats.as_dict()))
+
+
+def test_stats_disabled():
+    with pytest.raises(ValueError):
+        Ashtadhyayi().stats()
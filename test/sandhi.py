@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+    test.sandhi
+    ~~~~~~~~~~~
+
+    Tests for the sandhi rules.
+
+    :license: MIT and BSD
+"""
+
+import pytest
+
+from vyakarana import sandhi
+
+
+@pytest.mark.parametrize(('x', 'y', 'result'), [
+    ('a', 'e', ('', 'e')),    # 6.1.97 ato guNe
+    ('i', 'I', ('', 'I')),    # 6.1.101 akaH savarNe dIrghaH
+    ('i', 'a', ('y', 'a')),   # 6.1.77 iko yaN aci
+    ('o', 'a', ('av', 'a')),  # 6.1.78 eco 'yavAyAvaH
+    ('A', 'i', ('', 'e')),    # 6.1.87 Ad guNaH
+    ('A', 'f', ('', 'ar')),
+    ('y', 'v', ('', 'v')),    # 6.1.66 lopo vyor vali
+    ('t', 'a', ('t', 'a')),
+])
+def test_sandhi(x, y, result):
+    assert sandhi.sandhi(x, y) == result
+    assert sandhi.SANDHI[x, y] == result
+
+
+def test_sandhi_not_a_sound():
+    assert sandhi.sandhi('ay', 'a') is None
+    assert ('ay', 'a') not in sandhi.SANDHI
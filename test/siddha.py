@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+    test.siddha
+    ~~~~~~~~~~~
+
+    Tests for the asiddha rules.
+
+    :license: MIT and BSD
+"""
+
+import pytest
+
+from vyakarana import siddha
+from vyakarana.derivations import State
+from vyakarana.siddha import SoundRule, Tripadi, LAST
+from vyakarana.terms import Upadesha, Pratyaya
+
+
+def asiddha(*terms):
+    state = State(terms)
+    return ''.join(t.asiddha for t in siddha.TRIPADI.apply(state))
+
+
+def test_sound_rule():
+    r = SoundRule('x', left='a', target='tT', right='i', when=LAST,
+                  replace='D')
+    assert r.matches('a', 't', 'i', None, LAST)
+    assert not r.matches('a', 't', 'i', None, 0)
+    assert not r.matches('A', 't', 'i', None, LAST)
+    assert not r.matches('a', 'd', 'i', None, LAST)
+    assert r.apply('t', 'i') == 'D'
+
+
+@pytest.mark.parametrize(('terms', 'result'), [
+    # 8.2.30 coH kuH, 8.4.55 khari ca
+    ((Upadesha.as_dhatu('va\\ca~'), Pratyaya('kta')), 'vakta'),
+    # 8.2.36, 8.4.41 STunA STuH
+    ((Upadesha.as_dhatu('ya\\ja~^'), Pratyaya('tfc')), 'yazwf'),
+    # 8.2.30, 8.2.41, 8.3.59
+    ((Upadesha.as_dhatu('Bu\\ja~'), Pratyaya('sya')), 'Bukzya'),
+    # 8.4.1 raSAbhyAM no NaH samAnapade
+    ((Upadesha('rAma'), Upadesha('na')), 'rAmaRa'),
+    ((Upadesha.as_dhatu('kzuBa~'), Pratyaya('nA')), 'kzuBnA'),
+])
+def test_apply(terms, result):
+    assert asiddha(*terms) == result
+
+
+def test_apply_unchanged():
+    state = State([Upadesha('rAma')])
+    assert siddha.TRIPADI.apply(state) is state
+
+
+def test_transition_table():
+    tripadi = Tripadi()
+    first = tripadi.transition('a', 'c', 't', None, 0)
+    assert first == ('k', False)
+    assert tripadi.transition('a', 'c', 't', None, 0) is first
+
+
+@pytest.mark.parametrize(('value', 'result'), [
+    # 8.4.41 applies to sounds that were in 'stu' before 8.4.40
+    ('hTS', 'wwS'),
+    ('wzhRTgRtc', 'wzhRqgRwc'),
+])
+def test_apply_zwutva_after_scutva(value, result):
+    assert asiddha(Upadesha('a').set_value(value)) == result
@@ -35,6 +35,17 @@ class TestSound(object):
             assert v.savarna(L.lower())
             assert v.savarna(L.upper())
 
+    def test_closest(self):
+        assert Sound('k').closest(Sounds('cu')) == 'c'
+        assert Sound('J').closest(Sounds('jaS')) == 'j'
+        assert Sound('Q').closest(Sounds('car')) == 'w'
+        # Plain lists give the same result as collections.
+        for x in 'kKgGNh':
+            cu = Sounds('cu')
+            assert Sound(x).closest(cu) == Sound(x).closest(list(cu))
+        # No close sound
+        assert Sound('_').closest(Sounds('cu')) == '_'
+
 
 class TestSoundCollection(object):
 
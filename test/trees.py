@@ -10,7 +10,10 @@
 
 import pytest
 
-from vyakarana import expand, trees
+from vyakarana import expand, reranking, trees
+from vyakarana.ashtadhyayi import Ashtadhyayi
+from vyakarana.derivations import State
+from vyakarana.terms import Upadesha, Vibhakti
 
 
 def apavada():
@@ -81,3 +84,72 @@ def apavada():
 @pytest.mark.parametrize(('rule', 'expected', 'observed'), apavada())
 def test_apavada(rule, expected, observed):
     assert expected == observed
+
+
+def _tree_names(tree):
+    """Return a comparable description of a tree."""
+    children = sorted((f.name, i, _tree_names(t))
+                      for (f, i), t in tree.features.iteritems())
+    return (sorted(r.name for r in tree.rules), children)
+
+
+@pytest.fixture
+def compiled():
+    stubs = expand.fetch_stubs_in_range('3.1.68', '3.1.82')
+    rules = expand.build_from_stubs(stubs)
+    tree = trees.RuleTree(rules, ranker=reranking.CompositeRanker())
+    new_rules = expand.build_from_stubs(stubs)
+    return tree, rules, new_rules
+
+
+def test_from_data(compiled):
+    tree, rules, new_rules = compiled
+    new_tree = trees.RuleTree.from_data(new_rules, tree.to_data(rules))
+
+    assert ([r.name for r in new_tree.ranked_rules] ==
+            [r.name for r in tree.ranked_rules])
+    assert _tree_names(new_tree) == _tree_names(tree)
+    for old, new in zip(rules, new_rules):
+        assert (set(r.name for r in old.apavada) ==
+                set(r.name for r in new.apavada))
+        assert (sorted(r.name for r in old.utsarga) ==
+                sorted(r.name for r in new.utsarga))
+
+
+def test_save_and_load(compiled, tmpdir):
+    tree, rules, new_rules = compiled
+    path = str(tmpdir.join('tree.pickle'))
+    assert trees.RuleTree.load(path, new_rules) is None
+
+    tree.save(path, rules)
+    new_tree = trees.RuleTree.load(path, new_rules)
+    assert _tree_names(new_tree) == _tree_names(tree)
+
+    # Different rules -> out of date
+    assert trees.RuleTree.load(path, new_rules[1:]) is None
+
+
+def test_conflict_index():
+    rules = expand.build_from_stubs()
+    index = trees.ConflictIndex(rules)
+    for rule in rules:
+        candidates = set(index.candidates(rule))
+        for j, other in enumerate(rules):
+            if rule.has_apavada(other):
+                assert j in candidates
+
+
+@pytest.mark.parametrize('dhatu', ['BU', 'qukf\\Y', 'ya\\ja~^'])
+def test_select_cached(dhatu):
+    a = Ashtadhyayi()
+    tree = a.rule_tree
+    la = Vibhakti('li~w').add_samjna('prathama', 'ekavacana')
+    stack = [State([Upadesha.as_dhatu(dhatu), la])]
+    while stack:
+        state = stack.pop()
+        for i in range(len(state)):
+            selection = tree.select_cached(state, i)
+            assert set(selection) == tree.select(state, i)
+            ranks = [r.rank for r in selection]
+            assert ranks == sorted(ranks)
+        stack.extend(a._apply_next_rule(state) or [])
@@ -64,6 +64,41 @@ def test_init_no_raw():
     assert u.parts == 'parts'
 
 
+def test_interning():
+    u = Upadesha('vu~k')
+    assert Upadesha('vu~k') is u
+    assert u.add_samjna('anga') is u.add_samjna('anga')
+    assert u.add_samjna('anga') is not u
+    assert Pratyaya('vu~k') is not u
+    assert len(set([u, Upadesha('vu~k'), u.add_op('r')])) == 2
+
+    # Equal terms share a filter cache.
+    u._filter_cache['f'] = True
+    assert Upadesha('vu~k')._filter_cache == {'f': True}
+    assert isinstance(u.samjna, frozenset)
+
+
+def test_tags():
+    t = Tags(['kit', 'dhatu'])
+    assert t == set(['kit', 'dhatu'])
+    assert t.mask == TAGS.mask(['kit', 'dhatu'])
+    assert hash(t) == hash(frozenset(['kit', 'dhatu']))
+
+    t2 = t.union(['anga'])
+    assert isinstance(t2, Tags)
+    assert t2 == set(['kit', 'dhatu', 'anga'])
+    assert t2.mask == t.mask | TAGS.bit('anga')
+    assert t.union(['kit']) is t
+
+    t3 = t2 - set(['kit'])
+    assert isinstance(t3, Tags)
+    assert t3 == Tags(['dhatu', 'anga'])
+
+    u = Upadesha.as_dhatu('qukf\\Y')
+    assert isinstance(u.samjna, Tags)
+    assert u.samjna.mask & TAGS.bit('dhatu')
+
+
 # Properties
 # ~~~~~~~~~~
 
@@ -57,3 +57,83 @@ def test_sound_editor_prev_next(editor_data):
             assert prev.value == data[i - 1]
         if i < len(data) - 1:
             assert next.value == data[i + 1]
+
+
+def test_sound_editor_cursor(editor_data):
+    data, terms, state, editor = editor_data
+    cursor = next(iter(editor))
+    assert cursor.value == 'a'
+    assert cursor.prev.value is None
+    assert cursor.first and not cursor.last
+    assert cursor.term is terms[0]
+
+    cursor.index = 7
+    assert cursor.term is terms[1]
+    assert cursor.state_index == 1
+    assert cursor.term_index == 1
+    assert cursor.next.next.value == 'j'
+
+    with pytest.raises(IndexError):
+        cursor.prev.prev.prev.prev.prev.prev.prev.prev.value = 'x'
+
+
+def test_sound_editor_join(editor_data):
+    data, terms, state, editor = editor_data
+    assert editor.join() is state
+
+    for cursor in editor:
+        if cursor.value == 'h':
+            cursor.value = 'H'
+    new_state = editor.join()
+    assert new_state[1].asiddha == 'gHijkl'
+    assert new_state[0] is terms[0]
+    assert new_state[2] is terms[2]
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+
+    # 'b' is the least recently used
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert len(cache) == 2
+
+    assert cache.get('b') is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.stats()['hit_rate'] == 0.5
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == cache.misses == 0
+
+
+def test_bit_registry():
+    registry = BitRegistry(['a', 'b'])
+    assert registry.bit('a') == 1
+    assert registry.bit('b') == 2
+    assert 'c' not in registry
+
+    # New values are registered on demand.
+    assert registry.mask(['a', 'c']) == 5
+    assert 'c' in registry
+    assert len(registry) == 3
+    assert registry.decode(6) == ['b', 'c']
+
+
+def test_atomic_open(tmpdir):
+    path = tmpdir.join('data')
+    with atomic_open(str(path)) as f:
+        f.write('abc')
+    assert path.read() == 'abc'
+
+    with pytest.raises(ValueError):
+        with atomic_open(str(path)) as f:
+            f.write('def')
+            raise ValueError
+    assert path.read() == 'abc'
+    assert tmpdir.listdir() == [path]
@@ -37,12 +37,15 @@ def do_dvirvacana(state, i, locus=None):
     return state.swap(i, abhyasta).insert(i, abhyasa)
 
 
+#: Maps a retroflex sound to its dental when *ṣ* becomes *s*.
+SA_ADESHA = {'w': 't', 'W': 'T', 'R': 'n'}
+
+
 @O.DataOperator.no_params
 def sa_adesha(value):
     if value.startswith('z'):
-        converter = {'w': 't', 'W': 'T', 'R': 'n'}
         v = value[1]
-        value = 's' + converter.get(v, v) + value[2:]
+        value = 's' + SA_ADESHA.get(v, v) + value[2:]
     return value
 
 
@@ -26,15 +26,17 @@ from ..terms import Upadesha as U
 f = F.auto
 
 
+AC = Sounds('ac')
+NASAL = Sounds('Yam')
+
+
 @O.DataOperator.no_params
 def shnam_lopa(value):
-    ac = Sounds('ac')
-    nasal = Sounds('Yam')
     letters = list(reversed(value))
     for i, L in enumerate(letters):
-        if L in ac:
+        if L in AC:
             break
-        if L in nasal:
+        if L in NASAL:
             letters[i] = ''
             break
     return ''.join(reversed(letters))
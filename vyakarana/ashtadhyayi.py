@@ -8,14 +8,94 @@
     :license: MIT and BSD
 """
 
+import os
+from collections import namedtuple
+
 import expand
+import profiling
 import reranking
 import sandhi
 import siddha
 import trees
 
-from . import logger
 from derivations import State
+from lists import PADA, PURUSHA, VACANA
+from templates import Vibhasha
+from terms import Upadesha, Vibhakti
+from util import LRUCache
+
+#: The default number of derivations to keep in the derivation cache.
+CACHE_SIZE = 10000
+
+#: The number of rule selections to keep for reuse across derivations.
+SELECTION_CACHE_SIZE = 50000
+
+#: The default maximum number of states to explore in one derivation.
+MAX_STATES = 100000
+
+#: The default maximum number of rules applied along any one branch of
+#: a derivation.
+MAX_DEPTH = 1000
+
+vyak = os.path.dirname(os.path.dirname(__file__))
+#: The location of the compiled rule tree written by
+#: ``python -m vyakarana.build``. To use it, pass it as `tree_file`.
+RULE_TREE_FILE = os.path.join(vyak, 'data', 'rule_tree.pickle')
+
+
+#: A result from :meth:`Ashtadhyayi.derive` with ``provenance=True``.
+#: `path` is a tuple of ``(rule_id, index, branch)`` triples, one for
+#: each rule applied: the rule's rank in the rule tree, the index where
+#: it applied, and the position of the chosen state among the states
+#: it produced. Use :meth:`Ashtadhyayi.replay` to rebuild the states.
+Provenance = namedtuple('Provenance', ['result', 'path'])
+
+
+def _unwind(node):
+    """Convert a linked list of path items to a tuple, oldest first."""
+    returned = []
+    while node is not None:
+        item, node = node
+        returned.append(item)
+    returned.reverse()
+    return tuple(returned)
+
+
+def _is_ancestor(state, node):
+    """Return whether `state` is in a linked list of ancestor states."""
+    while node is not None:
+        ancestor, node = node
+        if ancestor == state:
+            return True
+    return False
+
+
+class DerivationLimitError(RuntimeError):
+
+    """Raised when a derivation explores too many states, goes too
+    deep, or returns to an earlier state on the same branch. This
+    almost always means that some rule applies in a loop.
+
+    :param limit: the name of the limit that was exceeded, i.e.
+                  ``'max_states'`` or ``'max_depth'``, or ``'cycle'``
+                  if a rule produced one of the state's own ancestors
+    :param value: the value of that limit, or ``None`` for ``'cycle'``
+    :param state: the state being expanded when the limit was hit
+    :param path: the provenance path to `state`, as in
+                 :class:`Provenance`, or ``None`` if the derivation
+                 didn't track provenance
+    """
+
+    def __init__(self, limit, value, state, path=None):
+        if limit == 'cycle':
+            message = 'cycle at %s' % state
+        else:
+            message = '%s=%s exceeded at %s' % (limit, value, state)
+        RuntimeError.__init__(self, message)
+        self.limit = limit
+        self.value = value
+        self.state = state
+        self.path = path
 
 
 class Ashtadhyayi(object):
@@ -31,12 +111,93 @@ class Ashtadhyayi(object):
     represent finished words.
     """
 
-    def __init__(self, stubs=None):
+    def __init__(self, stubs=None, cache_size=CACHE_SIZE,
+                 tree_file=None, trace=None, profile=False,
+                 max_states=MAX_STATES, max_depth=MAX_DEPTH):
+        #: A trace sink used by every derivation, or ``None``. For
+        #: details, see :mod:`vyakarana.tracing`.
+        self.trace = trace
+
+        #: The maximum number of distinct states to explore in one
+        #: derivation, or ``None`` for no limit.
+        self.max_states = max_states
+
+        #: The maximum number of rules to apply along any one branch of
+        #: a derivation, or ``None`` for no limit.
+        self.max_depth = max_depth
+
+        #: A :class:`~vyakarana.profiling.Profiler`, or ``None`` if
+        #: `profile` is false. It stays enabled until :meth:`close`.
+        #: See :meth:`stats`.
+        self.profiler = None
+        if profile:
+            self.profiler = profiling.Profiler()
+            self.profiler.enable()
+
         rules = expand.build_from_stubs(stubs)
-        ranker = reranking.CompositeRanker()
 
+        # The compiled tree is used only for the full set of rules.
+        if stubs is not None:
+            tree_file = None
+
+        # Persistence is opt-in. If `tree_file` is missing or out of
+        # date, it's rewritten, so it must be writable.
         #: Indexed arrangement of rules
-        self.rule_tree = trees.RuleTree(rules, ranker=ranker)
+        self.rule_tree = None
+        if tree_file:
+            self.rule_tree = trees.RuleTree.load(tree_file, rules)
+        if self.rule_tree is None:
+            ranker = reranking.CompositeRanker()
+            self.rule_tree = trees.RuleTree(rules, ranker=ranker)
+            if tree_file:
+                self.rule_tree.save(tree_file, rules)
+
+        #: Maps the fingerprint of a starting state to the list of
+        #: results derived from it. If `cache_size` is 0, the cache is
+        #: not used.
+        self.cache = LRUCache(cache_size)
+
+        #: Rule selections shared by every derivation. See
+        #: :meth:`~vyakarana.trees.RuleTree.select_cached`.
+        self.selections = LRUCache(SELECTION_CACHE_SIZE)
+
+        #: Rules whose filters test for puruṣa or vacana. These are
+        #: used to decide where a paradigm derivation must fork.
+        person_number = set(PURUSHA + VACANA)
+        self.paradigm_rules = [r for r in self.rule_tree.ranked_rules
+                               if any(f.mentions(person_number)
+                                      for f in r.filters)]
+
+    def close(self):
+        """Disable this instance's profiler, if any.
+
+        Only one profiler can be enabled at a time, so an instance
+        created with ``profile=True`` must be closed before another
+        one is created. The counts are kept, and :meth:`stats` still
+        works afterward.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        """Return the rule and filter counts collected so far.
+
+        This requires ``profile=True``. Counts cover every derivation
+        in the process while the profiler is enabled. Derivations
+        answered from the result cache do no work and add nothing. For
+        details, see :mod:`vyakarana.profiling`.
+
+        :returns: a :class:`~vyakarana.profiling.Stats` object
+        """
+        if self.profiler is None:
+            raise ValueError('Profiling is off. Use profile=True.')
+        return self.profiler.stats()
 
     @classmethod
     def with_rules_in(cls, start, end, **kw):
@@ -51,13 +212,26 @@ class Ashtadhyayi(object):
         stubs = expand.fetch_stubs_in_range(start, end)
         return cls(stubs=stubs, **kw)
 
-    def _apply_next_rule(self, state):
+    def _apply_next_rule(self, state, trace=None):
         """Apply one rule and return a list of new states.
 
+        :param state: the current state
+        :param trace: a trace sink, or ``None``
+        """
+        applied = self._next_rule(state, trace)
+        if applied is not None:
+            return applied[2]
+
+    def _next_rule(self, state, trace=None):
+        """Apply one rule and return it along with the new states.
+
         This function applies conflict resolution to a list of candidate
         rules until one rule remains.
 
         :param state: the current state
+        :param trace: a trace sink, or ``None``
+        :returns: a ``(rule, index, states)`` tuple, or ``None`` if no
+                  rule applies.
         """
         for ra, ia in self.rule_tree.candidates(state):
             # Ignore redundant applications
@@ -69,9 +243,43 @@ class Ashtadhyayi(object):
             if not ra_states:
                 continue
 
-            for s in ra_states:
-                logger.debug('  %s : %s --> %s' % (ra.name, state, s))
-            return ra_states
+            if trace is not None:
+                for s in ra_states:
+                    trace('apply', ra, ia, state, s)
+            return ra, ia, ra_states
+
+    def _apply_shared_rule(self, state):
+        """Apply one rule that doesn't depend on puruṣa or vacana.
+
+        This is like :meth:`_apply_next_rule`, but it returns ``None``
+        if the next rule might depend on the puruṣa or vacana of the
+        state's vibhakti. The state must then be forked.
+
+        :param state: the current state, whose vibhakti has no puruṣa
+                      or vacana
+        """
+        vi = _vibhakti_index(state)
+        if vi is None:
+            return None
+
+        person_number = set(PURUSHA + VACANA)
+        for rule in self.paradigm_rules:
+            for ia in range(len(state)):
+                if _might_match(rule, state, ia, person_number):
+                    return None
+
+        for ra, ia in self.rule_tree.candidates(state):
+            if ra in state[ia].ops:
+                continue
+
+            # The operator might read the vibhakti's puruṣa or vacana.
+            if (ia + ra.offset == vi and
+                    ra.operator.category != 'add_samjna'):
+                return None
+
+            ra_states = list(ra.apply(state, ia))
+            if ra_states:
+                return ra_states
 
     def _sandhi_asiddha(self, state):
         """Apply rules from the 'sandhi' and 'asiddha' sections.
@@ -85,24 +293,286 @@ class Ashtadhyayi(object):
             for t in siddha.asiddha(s):
                 yield ''.join(x.asiddha for x in t)
 
-    def derive(self, sequence):
+    def derive(self, sequence, trace=None, provenance=False):
         """Yield all possible results.
 
+        Results are cached by the fingerprint of the starting state, so
+        repeated calls on the same input are just a lookup. A result
+        list is cached only once it's been consumed in full. The cache
+        is skipped while tracing or tracking provenance.
+
+        :param sequence: a starting sequence
+        :param trace: a trace sink for this call. If ``None``, use
+                      `self.trace`.
+        :param provenance: if ``True``, yield a :class:`Provenance`
+                           for each result, which records the rules
+                           that produced it.
+        """
+        start = State(sequence, selections=self.selections,
+                      track_history=False)
+        if trace is None:
+            trace = self.trace
+
+        cache = self.cache
+        if cache.max_size == 0 or trace is not None or provenance:
+            for result in self._derive(start, trace, provenance=provenance):
+                yield result
+            return
+
+        key = start.fingerprint()
+        results = cache.get(key)
+        if results is not None:
+            for result in results:
+                yield result
+            return
+
+        results = []
+        for result in self._derive(start):
+            results.append(result)
+            yield result
+        cache[key] = results
+
+    def derive_iter(self, sequence, limit=None, order='preferred'):
+        """Yield distinct results lazily, in order of preference.
+
+        Unlike :meth:`derive`, this stops exploring the derivation once
+        `limit` results have been found, so asking for just the first
+        result skips the work of deriving every optional variant. The
+        result cache is not used.
+
         :param sequence: a starting sequence
+        :param limit: the maximum number of results to yield. If
+                      ``None``, yield all of them.
+        :param order: the order in which to explore optional rules:
+
+                      - ``'preferred'``: for a
+                        :class:`~vyakarana.templates.Va` rule, try the
+                        accepted option first; for a
+                        :class:`~vyakarana.templates.Vibhasha` rule,
+                        try the declined option first. Other options
+                        are accepted first.
+                      - ``'default'``: the same order as :meth:`derive`,
+                        which tries every accepted option first.
+        """
+        if order not in ('preferred', 'default'):
+            raise ValueError('Unknown order: %r' % (order,))
+        if limit is not None and limit <= 0:
+            return
+
+        start = State(sequence, selections=self.selections,
+                      track_history=False)
+        seen = set()
+        for result in self._derive(start, self.trace,
+                                   preferred=(order == 'preferred')):
+            if result in seen:
+                continue
+            seen.add(result)
+            yield result
+            if limit is not None and len(seen) >= limit:
+                return
+
+    def derive_paradigm(self, dhatu, la, pada=None):
+        """Derive all of the tiṅanta forms of some dhatu.
+
+        Rules that apply before the choice of puruṣa and vacana matters
+        are applied just once. The derivation forks only at the first
+        rule that could depend on the puruṣa or vacana of the vibhakti.
+
+        :param dhatu: a dhatu, as an :class:`~vyakarana.terms.Upadesha`
+                      or as a raw string
+        :param la: the upadeśa name of one of the lakāras
+        :param pada: ``'parasmaipada'`` or ``'atmanepada'``. If ``None``,
+                     derive for both.
+        :returns: if `pada` is defined, a 3x3 table of result sets,
+                  indexed by puruṣa then vacana. Otherwise, a `dict`
+                  that maps each pada to such a table.
+        :raises DerivationLimitError: if the derivation exceeds
+                                      `max_states` or `max_depth`, or
+                                      if a rule applies in a cycle
         """
-        start = State(sequence)
-        stack = [start]
+        if isinstance(dhatu, basestring):
+            dhatu = Upadesha.as_dhatu(dhatu)
 
-        logger.debug('---')
-        logger.debug('start: %s' % start)
+        max_states = self.max_states
+        max_depth = self.max_depth
+        tables = {}
+        start = State([dhatu, Vibhakti(la)], selections=self.selections,
+                      track_history=False)
+        stack = [(start, 0, None)]
+        seen = set([start])
         while stack:
-            state = stack.pop()
-            new_states = self._apply_next_rule(state)
+            state, depth, ancestors = stack.pop()
+            new_states = self._apply_shared_rule(state)
             if new_states:
-                stack.extend(new_states)
+                depth += 1
+                if max_depth is not None and depth > max_depth:
+                    raise self._limit_error('max_depth', state, None, False)
+                ancestors = (state, ancestors)
+                for s in new_states:
+                    if s not in seen:
+                        seen.add(s)
+                        stack.append((s, depth, ancestors))
+                    elif _is_ancestor(s, ancestors):
+                        raise self._limit_error('cycle', state, None, False)
+                if max_states is not None and len(seen) > max_states:
+                    raise self._limit_error('max_states', state, None, False)
+                continue
+
+            vi = _vibhakti_index(state)
+            if vi is None:
+                continue
+            vibhakti = state[vi]
+            state_pada = None
+            for p in PADA:
+                if p in vibhakti.samjna:
+                    state_pada = p
+                    break
+            if pada is not None and state_pada != pada:
+                continue
+
+            table = tables.get(state_pada)
+            if table is None:
+                table = tables[state_pada] = _empty_table()
+            for i, purusha in enumerate(PURUSHA):
+                for j, vacana in enumerate(VACANA):
+                    term = vibhakti.add_samjna(purusha, vacana)
+                    start = state.swap(vi, term)
+                    table[i][j].update(self._derive(start, self.trace))
+
+        if pada is not None:
+            return tables.get(pada) or _empty_table()
+        return tables
+
+    def replay(self, sequence, path):
+        """Rebuild the states along a provenance path.
+
+        :param sequence: the starting sequence passed to :meth:`derive`
+        :param path: the `path` of some :class:`Provenance` from this
+                     :class:`Ashtadhyayi`
+        :returns: a list of states, from the starting state to the
+                  final state. Each state tracks its history.
+        """
+        rules = self.rule_tree.ranked_rules
+        state = State(sequence, selections=self.selections)
+        returned = [state]
+        for rule_id, index, branch in path:
+            state = list(rules[rule_id].apply(state, index))[branch]
+            returned.append(state)
+        return returned
+
+    def _derive(self, start, trace=None, preferred=False, provenance=False):
+        """Yield all possible results without using the cache.
+
+        Optional rules fork the derivation, and different branches
+        often converge on the same state. A state's terms include the
+        rules applied to them, so two equal states have the same future
+        and each distinct state is explored just once. But if a rule
+        produces one of the state's own ancestors, the derivation would
+        never finish, so that's an error.
+
+        Branches are explored depth first. An optional rule yields its
+        declined state and then its accepted one, and the last state
+        pushed is explored first, so accepted options come first.
+
+        :param start: the starting state
+        :param trace: a trace sink, or ``None``
+        :param preferred: if ``True``, explore the declined option of a
+                          :class:`~vyakarana.templates.Vibhasha` rule
+                          first.
+        :param provenance: if ``True``, yield a :class:`Provenance` for
+                           each result. Each path is stored as a linked
+                           list that shares its prefix with the paths
+                           of sibling branches, and it's converted to
+                           a tuple only for the states that produce
+                           results.
+        :raises DerivationLimitError: if the derivation exceeds
+                                      `max_states` or `max_depth`, or
+                                      if a rule applies in a cycle
+        """
+        max_states = self.max_states
+        max_depth = self.max_depth
+        stack = [(start, 0, None, None)]
+        seen = set([start])
+
+        if trace is not None:
+            trace('start', start)
+        while stack:
+            state, depth, path, ancestors = stack.pop()
+            applied = self._next_rule(state, trace)
+            if applied is not None:
+                ra, ia, new_states = applied
+                branches = enumerate(new_states)
+                if preferred and ra.modifier is Vibhasha:
+                    branches = reversed(list(branches))
+
+                depth += 1
+                if max_depth is not None and depth > max_depth:
+                    raise self._limit_error('max_depth', state, path,
+                                            provenance)
+                ancestors = (state, ancestors)
+                for branch, s in branches:
+                    if s not in seen:
+                        seen.add(s)
+                        if provenance:
+                            node = ((ra.rank, ia, branch), path)
+                        else:
+                            node = None
+                        stack.append((s, depth, node, ancestors))
+                    elif _is_ancestor(s, ancestors):
+                        raise self._limit_error('cycle', state, path,
+                                                provenance)
+                if max_states is not None and len(seen) > max_states:
+                    raise self._limit_error('max_states', state, path,
+                                            provenance)
 
             # No applicable rules; state is in its final form.
             else:
+                if provenance:
+                    path = _unwind(path)
                 for result in self._sandhi_asiddha(state):
-                    logger.debug('yield: %s' % result)
-                    yield result
+                    if trace is not None:
+                        trace('yield', state, result)
+                    if provenance:
+                        yield Provenance(result, path)
+                    else:
+                        yield result
+
+    def _limit_error(self, limit, state, path, provenance):
+        """Create a :class:`DerivationLimitError`.
+
+        :param limit: ``'max_states'``, ``'max_depth'``, or ``'cycle'``
+        :param state: the state being expanded
+        :param path: the state's provenance path, as a linked list
+        :param provenance: whether `path` was tracked
+        """
+        path = _unwind(path) if provenance else None
+        value = getattr(self, limit, None)
+        return DerivationLimitError(limit, value, state, path)
+
+
+def _empty_table():
+    return [[set() for v in VACANA] for p in PURUSHA]
+
+
+def _might_match(rule, state, index, ignored):
+    """Return whether `rule` could match `state` at `index` if we
+    disregard any filters that mention the values in `ignored`.
+
+    :param rule: a rule
+    :param state: a state
+    :param index: the index where the rule's first filter applies
+    :param ignored: a collection of values to disregard
+    """
+    for i, filt in enumerate(rule.filters):
+        for s in filt.supersets:
+            if not s.mentions(ignored) and not s.allows(state, index + i):
+                return False
+    return True
+
+
+def _vibhakti_index(state):
+    """Return the index of the state's vibhakti, or ``None``."""
+    for i, term in enumerate(state):
+        if 'vibhakti' in term.samjna:
+            return i
+    return None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    vyakarana.build
+    ~~~~~~~~~~~~~~~
+
+    Writes the data files that make the package faster to load:
+
+    - the Dhātupāṭha index, which is read on import if it's present
+    - the compiled rule tree, which is read only by an
+      :class:`~vyakarana.ashtadhyayi.Ashtadhyayi` created with
+      ``tree_file=RULE_TREE_FILE``
+
+    Importing the package never writes these files, so they must be
+    created ahead of time, e.g. once after installing or after changing
+    the data. From the repository root::
+
+        python -m vyakarana.build
+
+    The files are ignored once they're out of date, so it's always safe
+    to skip this step.
+
+    :license: MIT and BSD
+"""
+
+import argparse
+import sys
+
+import expand
+import reranking
+import trees
+from ashtadhyayi import RULE_TREE_FILE
+from dhatupatha import Dhatupatha, DHATUPATHA_CSV, DHATUPATHA_INDEX
+
+
+def build_dhatupatha(path=DHATUPATHA_INDEX):
+    """Write the Dhātupāṭha index to `path`.
+
+    :param path: the destination path
+    """
+    Dhatupatha(DHATUPATHA_CSV).save(path, DHATUPATHA_CSV)
+    return path
+
+
+def build_rule_tree(path=RULE_TREE_FILE):
+    """Write the compiled rule tree for the full set of rules to `path`.
+
+    :param path: the destination path
+    """
+    rules = expand.build_from_stubs()
+    tree = trees.RuleTree(rules, ranker=reranking.CompositeRanker())
+    tree.save(path, rules)
+    return path
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Write precomputed data files.')
+    parser.add_argument('--dhatupatha-index', metavar='FILE',
+                        default=DHATUPATHA_INDEX,
+                        help='where to write the Dhatupatha index')
+    parser.add_argument('--rule-tree', metavar='FILE',
+                        default=RULE_TREE_FILE,
+                        help='where to write the compiled rule tree')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    print 'wrote', build_dhatupatha(options.dhatupatha_index)
+    print 'wrote', build_rule_tree(options.rule_tree)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+    vyakarana.bulk
+    ~~~~~~~~~~~~~~
+
+    Derives large numbers of words across multiple processes.
+
+    Each input is a 4-tuple of plain strings::
+
+        (dhatu, la, purusha, vacana)
+
+    e.g. ``('BU', 'la~w', 'prathama', 'ekavacana')``. Plain strings are
+    cheap to send between processes, and each worker process builds its
+    own :class:`~vyakarana.ashtadhyayi.Ashtadhyayi` just once.
+
+    :license: MIT and BSD
+"""
+
+import itertools
+import multiprocessing
+from collections import namedtuple
+
+from ashtadhyayi import Ashtadhyayi
+from dhatupatha import DHATUPATHA
+from lists import PURUSHA, VACANA
+from terms import Upadesha, Vibhakti
+
+
+#: The result of a single derivation. `forms` is a sorted list of
+#: results. If the derivation failed, `forms` is ``None`` and `error`
+#: describes the exception.
+Result = namedtuple('Result', ['input', 'forms', 'error'])
+
+
+#: The worker's :class:`~vyakarana.ashtadhyayi.Ashtadhyayi`. This is
+#: created once per process by :func:`_init_worker`.
+_ashtadhyayi = None
+
+
+def _init_worker():
+    global _ashtadhyayi
+    _ashtadhyayi = Ashtadhyayi()
+
+
+def _derive_one(item):
+    """Derive the forms for a single input and catch any errors.
+
+    :param item: a 4-tuple of (dhatu, la, purusha, vacana)
+    """
+    dhatu, la, purusha, vacana = item
+    try:
+        d = Upadesha.as_dhatu(dhatu)
+        p = Vibhakti(la).add_samjna(purusha, vacana)
+        forms = sorted(set(_ashtadhyayi.derive([d, p])))
+        return Result(item, forms, None)
+    except Exception as e:
+        return Result(item, None, '%s: %s' % (e.__class__.__name__, e))
+
+
+def all_inputs(las=('la~w', 'li~w', 'lf~w'), dhatus=None):
+    """Generate inputs for every combination of the given values.
+
+    :param las: the lakāras to use
+    :param dhatus: the dhatus to use. If ``None``, use every dhatu in
+                   the Dhātupāṭha.
+    """
+    if dhatus is None:
+        dhatus = DHATUPATHA.all_dhatu
+    return itertools.product(dhatus, las, PURUSHA, VACANA)
+
+
+def derive_many(inputs, processes=None, chunksize=64, ordered=True):
+    """Derive the forms for each input and yield a :class:`Result`.
+
+    A failure in one derivation doesn't stop the others. Instead, the
+    error is reported in the corresponding :class:`Result`.
+
+    :param inputs: an iterable of (dhatu, la, purusha, vacana) tuples
+    :param processes: the number of worker processes. If ``None``, use
+                      one process per CPU. If 1, derive everything in
+                      the current process.
+    :param chunksize: the number of inputs to send to a worker at once
+    :param ordered: if ``True``, yield results in input order.
+                    Otherwise, yield results as soon as they finish.
+    """
+    if processes == 1:
+        global _ashtadhyayi
+        if _ashtadhyayi is None:
+            _init_worker()
+        for item in inputs:
+            yield _derive_one(item)
+        return
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker)
+    try:
+        if ordered:
+            results = pool.imap(_derive_one, inputs, chunksize)
+        else:
+            results = pool.imap_unordered(_derive_one, inputs, chunksize)
+        for result in results:
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -7,18 +7,42 @@
 """
 
 
-class State(object):
+#: The history of a state that doesn't track its history.
+_UNTRACKED = ()
 
-    """A sequence of terms.
 
-    This represents a single step in some derivation."""
+class State(object):
 
-    __slots__ = ['terms', 'history']
+    """A sequence of terms.
 
-    def __init__(self, terms=None, history=None):
-        #: A list of terms.
-        self.terms = terms or []
-        self.history = history or []
+    This represents a single step in some derivation.
+
+    States are persistent: every operation returns a new state and
+    shares as much as it can with the old one. Terms are stored in a
+    tuple, and history is stored as a linked list in which each state
+    points to its parent's history. So each step adds just one history
+    node instead of copying the entire history.
+
+    If `track_history` is false, no history is stored at all, and
+    neither is it stored for any state derived from this one.
+    """
+
+    __slots__ = ['_terms', '_history', 'selections']
+
+    def __init__(self, terms=None, history=None, selections=None,
+                 track_history=True):
+        self._terms = tuple(terms or ())
+        if track_history:
+            self._history = None
+            for item in history or ():
+                self._history = (item, self._history)
+        else:
+            self._history = _UNTRACKED
+        #: A cache of rule selections, shared by every state derived
+        #: from this one. This can be any object that supports `get`
+        #: and item assignment, e.g. a `dict`. See
+        #: :meth:`~vyakarana.trees.RuleTree.select_cached`.
+        self.selections = {} if selections is None else selections
 
     def __eq__(self, other):
         if other is None:
@@ -26,32 +50,68 @@ class State(object):
         if self is other:
             return True
 
-        return self.terms == other.terms
+        return self._terms == other._terms
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash(self._terms)
+
     def __getitem__(self, index):
-        return self.terms[index]
+        return self._terms[index]
 
     def __iter__(self):
-        return iter(self.terms)
+        return iter(self._terms)
 
     def __len__(self):
-        return len(self.terms)
+        return len(self._terms)
 
     def __repr__(self):
-        return '<State(%r)>' % self.terms
+        return '<State(%r)>' % list(self._terms)
 
     def __str__(self):
-        return repr([x.asiddha for x in self.terms])
+        return repr([x.asiddha for x in self._terms])
+
+    @property
+    def terms(self):
+        """A tuple of terms.
+
+        This used to be a list. It's now a tuple so that code that
+        tries to modify it fails instead of silently doing nothing. To
+        change a term, use :meth:`swap`.
+        """
+        return self._terms
+
+    @property
+    def history(self):
+        """A tuple of (rule, index) pairs, from first to last.
+
+        This is empty if the state doesn't track its history. Like
+        :attr:`terms`, it used to be a list and is now read-only.
+        """
+        returned = []
+        node = self._history
+        while node:
+            item, node = node
+            returned.append(item)
+        returned.reverse()
+        return tuple(returned)
+
+    def fingerprint(self):
+        """Return a hashable value that identifies this state's terms.
+
+        Two states have the same fingerprint if and only if their terms
+        are equal.
+        """
+        return tuple(t.fingerprint() for t in self._terms)
 
     def pprint(self):
         data = []
         append = data.append
         append('---------------------')
         append(str(self))
-        for item in self.terms:
+        for item in self._terms:
             append('  %s' % item)
             append('    data    : %s' % (tuple(item.data),))
             append('    samjna  : %s' % sorted(item.samjna))
@@ -60,31 +120,57 @@ class State(object):
         append('---------------------')
         print '\n'.join(data)
 
+    def _derive(self, terms, history=None):
+        """Create a new state that shares this state's selections.
+
+        :param terms: a tuple of terms
+        :param history: a history node. If ``None``, use this state's
+                        history.
+        """
+        c = State.__new__(State)
+        c._terms = terms
+        c._history = self._history if history is None else history
+        c.selections = self.selections
+        return c
+
     def copy(self):
-        return State(self.terms[:], self.history[:])
+        return self._derive(self._terms)
 
     def insert(self, index, term):
-        c = self.copy()
-        c.terms.insert(index, term)
-        return c
+        terms = self._terms
+        return self._derive(terms[:index] + (term,) + terms[index:])
+
+    @property
+    def tracks_history(self):
+        """Whether this state tracks its history."""
+        return self._history is not _UNTRACKED
 
     def mark_rule(self, rule, index):
-        c = self.copy()
-        c.history.append((rule, index))
-        c.terms[index] = c.terms[index].add_op(rule)
-        return c
+        term = self._terms[index].add_op(rule)
+        history = self._history
+        if history is not _UNTRACKED:
+            history = ((rule, index), history)
+        return self._derive(self._replaced(index, term), history)
 
     def remove(self, index):
-        c = self.copy()
-        c.terms.pop(index)
-        return c
+        return self._derive(self._replaced(index))
 
     def replace_all(self, terms):
-        c = self.copy()
-        c.terms = terms
-        return c
+        return self._derive(tuple(terms))
 
     def swap(self, index, term):
-        c = self.copy()
-        c.terms[index] = term
-        return c
+        return self._derive(self._replaced(index, term))
+
+    def _replaced(self, index, *new):
+        """Return a tuple of terms with the term at `index` replaced.
+
+        :param index: the index to replace. Like a list index, this
+                      raises `IndexError` if it's out of range.
+        :param new: the replacement terms, if any
+        """
+        terms = self._terms
+        if not -len(terms) <= index < len(terms):
+            raise IndexError(index)
+        if index < 0:
+            index += len(terms)
+        return terms[:index] + new + terms[index + 1:]
@@ -8,11 +8,30 @@
     :license: MIT and BSD
 """
 
+import hashlib
+import marshal
 import os
 from collections import defaultdict
 
+from util import atomic_open
+
 vyak = os.path.dirname(os.path.dirname(__file__))
 DHATUPATHA_CSV = os.path.join(vyak, 'data', 'dhatupatha.csv')
+#: The default location of the serialized index. Importing this module
+#: only reads it. To create it, run ``python -m vyakarana.build``.
+DHATUPATHA_INDEX = os.path.join(vyak, 'data', 'dhatupatha.index')
+
+#: Bump this whenever the format of :meth:`Dhatupatha.save` changes.
+INDEX_VERSION = 2
+
+
+def _digest(filename):
+    """Return a digest of the contents of `filename`.
+
+    :param filename: some path
+    """
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
 
 
 class Dhatupatha(object):
@@ -23,8 +42,9 @@ class Dhatupatha(object):
     the Dhātupāṭha and query for other properties of interest, such as
     the original gaṇa.
 
-    All data is stored in a CSV file, which is read when the program
-    begins.
+    All data is stored in a CSV file. Since parsing the file on every
+    start is wasteful, the parsed rows can also be stored in a compact
+    index file with :meth:`save` and read back with :meth:`load`.
 
     The Dhātupāṭha is traditionally given as a list of roots, each
     stated in upadeśa with a basic gloss. An example:
@@ -52,7 +72,12 @@ class Dhatupatha(object):
     """
 
     def __init__(self, filename=None):
-        self.gana_map = {}
+        #: The gana of each dhatu in `self.all_dhatu`.
+        self.gana_map = []
+
+        #: Maps a gana to the ``(start, end)`` slice of `self.all_dhatu`
+        #: that contains it.
+        self.gana_ranges = {}
 
         #: List of all dhatu, one for each row in the original CSV file.
         self.all_dhatu = []
@@ -70,16 +95,89 @@ class Dhatupatha(object):
         """
         :param filename: path to the Dhatupatha file
         """
+        rows = []
         with open(filename) as f:
-            i = 0
             for line in f:
                 if line.startswith('#') or not line.strip():
                     continue
                 gana, number, dhatu = line.strip().split(',')
-                self.all_dhatu.append(dhatu)
-                self.index_map[dhatu].append(i)
-                self.gana_map[i] = gana
-                i += 1
+                rows.append((gana, dhatu))
+        self._index(rows)
+
+    def _index(self, rows):
+        """Build all lookup tables from a list of rows.
+
+        :param rows: a list of ``(gana, dhatu)`` pairs, in order
+        """
+        for i, (gana, dhatu) in enumerate(rows):
+            gana = intern(gana)
+            dhatu = intern(dhatu)
+            self.all_dhatu.append(dhatu)
+            self.index_map[dhatu].append(i)
+            self.gana_map.append(gana)
+
+            try:
+                start, end = self.gana_ranges[gana]
+                self.gana_ranges[gana] = (start, i + 1)
+            except KeyError:
+                self.gana_ranges[gana] = (i, i + 1)
+
+    @classmethod
+    def load(cls, path, filename):
+        """Load a Dhātupāṭha saved with :meth:`save`.
+
+        :param path: the path to the saved index
+        :param filename: the CSV file used to create the index
+        :returns: the Dhātupāṭha, or ``None`` if the index is missing
+                  or out of date.
+        """
+        try:
+            with open(path, 'rb') as f:
+                payload = marshal.load(f)
+            version, digest, ganas, ranges, dhatus, index_map = payload
+            if version != INDEX_VERSION or digest != _digest(filename):
+                return None
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        # marshal keeps strings interned, so there's no need to
+        # re-index anything.
+        returned = cls()
+        returned.gana_map = ganas
+        returned.gana_ranges = ranges
+        returned.all_dhatu = dhatus
+        returned.index_map.update(index_map)
+        return returned
+
+    def save(self, path, filename):
+        """Save this Dhātupāṭha to `path`.
+
+        The index is tagged with a digest of `filename`, so it's
+        ignored once the CSV file changes.
+
+        :param path: the destination path
+        :param filename: the CSV file used to create this Dhātupāṭha
+        """
+        payload = (INDEX_VERSION, _digest(filename), self.gana_map,
+                   self.gana_ranges, self.all_dhatu, dict(self.index_map))
+        with atomic_open(path) as f:
+            marshal.dump(payload, f)
+
+    @classmethod
+    def cached(cls, filename, path):
+        """Load the index at `path`, or create it from `filename`.
+
+        If the index is missing or out of date, it's written to `path`,
+        so `path` must be writable.
+
+        :param filename: path to the Dhatupatha file
+        :param path: the path to the saved index
+        """
+        returned = cls.load(path, filename)
+        if returned is None:
+            returned = cls(filename)
+            returned.save(path, filename)
+        return returned
 
     def dhatu_list(self, start, end=None):
         """Get an inclusive list of of dhatus.
@@ -93,18 +191,8 @@ class Dhatupatha(object):
         # From `start` to the end of the gana
         if end is None:
             gana = self.gana_map[start_index]
-            returned = []
-            end_index = start_index
-            while True:
-                try:
-                    dhatu = self.all_dhatu[end_index]
-                    if self.gana_map[end_index] == gana:
-                        returned.append(dhatu)
-                    else:
-                        return returned
-                except IndexError:
-                    return returned
-                end_index += 1
+            end_index = self.gana_ranges[gana][1]
+            return self.all_dhatu[start_index:end_index]
 
         # From start to last instance of `end` (inclusive)
         else:
@@ -117,4 +205,5 @@ class Dhatupatha(object):
 
 #: A singleton instance available to all other modules. This has bad
 #: code smell, but I'm not compelled to change it.
-DHATUPATHA = Dhatupatha(DHATUPATHA_CSV)
+DHATUPATHA = (Dhatupatha.load(DHATUPATHA_INDEX, DHATUPATHA_CSV) or
+              Dhatupatha(DHATUPATHA_CSV))
@@ -15,13 +15,16 @@
 """
 
 from collections import defaultdict
+from operator import attrgetter
 
 import lists
 from dhatupatha import DHATUPATHA as DP
 from sounds import Sounds
-from terms import Upadesha
+from terms import TAGS, Upadesha
+from util import LRUCache
 
 FILTER_NAME_MAX_ARGS = 4
+FILTER_CACHE_SIZE = 100000
 DHATU_SET = set(DP.all_dhatu)
 
 
@@ -76,6 +79,13 @@ class Filter(object):
     def allows(self, state, index):
         return self.body(state, index)
 
+    def compile(self):
+        """Return the function that evaluates this filter.
+
+        For a general :class:`Filter`, this is just :attr:`body`.
+        """
+        return self.body
+
     def __and__(self, other):
         """Bitwise "and" (``&``).
 
@@ -289,6 +299,21 @@ class Filter(object):
                     returned.add(cur)
         return returned
 
+    def mentions(self, names):
+        """Return whether this filter tests for any of the given values.
+
+        This looks inside "and", "or", and "not" filters, so it can be
+        used on any filter. For example, ``samjna('kit') & al('ac')``
+        mentions ``'kit'``.
+
+        :param names: a collection of values, e.g. some saṃjñā
+        """
+        if self.category in ('and', 'or', 'not'):
+            return any(f.mentions(names) for f in self.domain)
+        if self.domain is None:
+            return False
+        return any(x in names for x in self.domain)
+
     def _domain_subset_of(self, other):
         if self.domain == other.domain:
             return True
@@ -346,19 +371,112 @@ class TermFilter(Filter):
     - Performance. Since we can guarantee that the output of a term
       filter will change only if its term changes, we can cache results
       for an unchanged term and avoid redundant calls.
+
+    Results are cached at two levels. Each term has its own cache,
+    which is fast but starts out empty whenever the term changes. Behind
+    that is :attr:`RESULTS`, which is shared by all terms and keyed on
+    just the term attributes that the filter reads. So if a rule changes
+    a term's `ops` or `samjna`, an :class:`al` filter still finds its
+    old result there.
     """
 
+    #: The term attributes that the filter reads. If ``None``, the
+    #: filter might read anything, so its results are cached against
+    #: the term's entire contents.
+    reads = None
+
+    #: A cache of filter results shared across all terms and
+    #: derivations. Use ``RESULTS.stats()`` to see its hit rate.
+    RESULTS = LRUCache(FILTER_CACHE_SIZE)
+
+    @property
+    def mask(self):
+        """The bitmask of this filter's domain. See
+        :class:`~vyakarana.terms.Tags`."""
+        try:
+            return self._mask
+        except AttributeError:
+            self._mask = TAGS.mask(self.domain or ())
+            return self._mask
+
     def allows(self, state, index):
         try:
             term = state[index]
-            name = self.name
-            cache = term._filter_cache
-            if name not in cache:
-                cache[name] = term and self.body(term)
-            return cache[name]
         except IndexError:
             return False
 
+        name = self.name
+        cache = term._filter_cache
+        try:
+            return cache[name]
+        except KeyError:
+            pass
+
+        key = (self, self.project(term))
+        results = TermFilter.RESULTS
+        result = results.get(key)
+        if result is None:
+            try:
+                predicate = self._predicate
+            except AttributeError:
+                predicate = self.compile()
+            result = results[key] = bool(term and predicate(term))
+        cache[name] = result
+        return result
+
+    def compile(self):
+        """Return a single function that evaluates this filter.
+
+        Evaluating an "and", "or", or "not" filter through its `body`
+        goes through one closure for each level of the filter tree. So
+        we flatten the tree into the source code for one function. See
+        :class:`_FilterCompiler` for details.
+        """
+        try:
+            return self._predicate
+        except AttributeError:
+            pass
+
+        if self.category in ('and', 'or', 'not'):
+            predicate = _FilterCompiler().compile(self)
+        else:
+            predicate = self.body
+        self._predicate = predicate
+        return predicate
+
+    def fields(self):
+        """Return the term attributes that this filter reads.
+
+        For "and", "or", and "not" filters, this is the union of the
+        fields of their parts.
+        """
+        if self.category not in ('and', 'or', 'not'):
+            return self.reads
+
+        returned = set()
+        for f in self.domain:
+            fields = f.fields()
+            if fields is None:
+                return None
+            returned.update(fields)
+        return tuple(sorted(returned))
+
+    def project(self, term):
+        """Return the part of `term` that this filter reads.
+
+        :param term: an :class:`~vyakarana.terms.Upadesha`
+        """
+        try:
+            getter = self._getter
+        except AttributeError:
+            fields = self.fields()
+            if fields:
+                getter = attrgetter(*fields)
+            else:
+                getter = attrgetter('_content_key')
+            getter = self._getter = getter
+        return getter(term)
+
     @classmethod
     def _make_and_body(cls, filters):
         bodies = [f.body for f in filters]
@@ -421,6 +539,126 @@ class DhatuFilter(UpadeshaFilter):
             return self._supersets
 
 
+class _FilterCompiler(object):
+
+    """Turns a tree of term filters into a single function.
+
+    Nested "and" and "or" filters are flattened into one boolean
+    expression. Within an "or", leaves of the same kind are merged,
+    e.g. ``samjna('kit') | samjna('Nit')`` becomes a single set test.
+    The cheapest tests are placed first so that evaluation can stop
+    early. Filters without a known template are called directly.
+    """
+
+    #: Maps a filter class to a cost, an expression template, and a
+    #: function that encodes a set of values as a constant. Each
+    #: template tests the term against that constant.
+    TEMPLATES = {}
+
+    #: The rough cost of calling a filter's body directly.
+    CALL_COST = 4
+
+    def __init__(self):
+        self.namespace = {}
+
+    def constant(self, value):
+        """Bind `value` to a new name and return the name.
+
+        :param value: any value that the generated code uses
+        """
+        name = '_c%d' % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def compile(self, filt):
+        """Return a function that evaluates `filt` on a term.
+
+        :param filt: a :class:`TermFilter`
+        """
+        cost, expr = self.expr(filt)
+        source = 'def predicate(term):\n    return %s\n' % expr
+        exec source in self.namespace
+        return self.namespace['predicate']
+
+    def expr(self, filt):
+        """Return a (cost, source) pair for `filt`.
+
+        :param filt: a :class:`TermFilter`
+        """
+        category = filt.category
+        if category == 'not':
+            cost, expr = self.expr(list(filt.domain)[0])
+            return (cost, '(not %s)' % expr)
+        if category in ('and', 'or'):
+            return self.combine(filt)
+
+        values = self.values(filt)
+        if values is None:
+            body = self.constant(filt.body)
+            return (self.CALL_COST, '%s(term)' % body)
+        return self.leaf(filt.__class__, values)
+
+    def combine(self, filt):
+        """Return a (cost, source) pair for an "and" or "or" filter.
+
+        :param filt: a :class:`TermFilter` whose category is ``'and'``
+                     or ``'or'``
+        """
+        category = filt.category
+        # Flatten nested filters with the same category.
+        leaves = []
+        stack = [filt]
+        while stack:
+            cur = stack.pop()
+            if cur.category == category:
+                stack.extend(cur.domain)
+            else:
+                leaves.append(cur)
+
+        parts = []
+        merged = {}
+        merged_order = []
+        for f in leaves:
+            values = self.values(f) if category == 'or' else None
+            if values is None:
+                parts.append(self.expr(f))
+            else:
+                cls = f.__class__
+                if cls not in merged:
+                    merged[cls] = set()
+                    merged_order.append(cls)
+                merged[cls].update(values)
+        for cls in merged_order:
+            parts.append(self.leaf(cls, merged[cls]))
+
+        parts.sort(key=lambda pair: pair[0])
+        cost = sum(c for c, e in parts)
+        joiner = ' %s ' % category
+        return (cost, '(%s)' % joiner.join(e for c, e in parts))
+
+    def leaf(self, cls, values):
+        """Return a (cost, source) pair for a set test.
+
+        :param cls: a filter class in :attr:`TEMPLATES`
+        :param values: the values to test against
+        """
+        cost, template, encode = self.TEMPLATES[cls]
+        return (cost, template % self.constant(encode(values)))
+
+    def values(self, filt):
+        """Return the values that `filt` tests for, or ``None``.
+
+        ``None`` means that there's no template for `filt`.
+
+        :param filt: a :class:`TermFilter`
+        """
+        if filt.__class__ not in self.TEMPLATES or filt.domain is None:
+            return None
+        if isinstance(filt, AlFilter):
+            return filt.domain.values
+        return filt.domain
+
+
 # Parameterized filters
 # ~~~~~~~~~~~~~~~~~~~~~
 # Each function accepts arbitrary arguments and returns a body.
@@ -430,6 +668,8 @@ class adi(AlFilter):
 
     """Filter on a term's first sound."""
 
+    reads = ('value',)
+
     def body(self, term):
         return term.adi in self.domain
 
@@ -438,6 +678,8 @@ class al(AlFilter):
 
     """Filter on a term's final sound."""
 
+    reads = ('value',)
+
     def body(self, term):
         return term.antya in self.domain
 
@@ -446,6 +688,8 @@ class contains(AlFilter):
 
     """Filter on whether a term has a certain sound."""
 
+    reads = ('value',)
+
     def body(self, term):
         return any(s in term.value for s in self.domain)
 
@@ -454,6 +698,8 @@ class dhatu(DhatuFilter):
 
     """Filter on whether a term represents a particular dhatu."""
 
+    reads = ('raw', 'samjna')
+
     def body(self, term):
         return term.raw in self.domain and 'dhatu' in term.samjna
 
@@ -475,22 +721,28 @@ class lakshana(UpadeshaFilter):
 
     """Filter on a term's prior values."""
 
+    reads = ('lakshana',)
+
     def body(self, term):
-        return any(x in term.lakshana for x in self.domain)
+        return bool(term.lakshana.mask & self.mask)
 
 
 class part(TermFilter):
 
     """Filter on a term's augments."""
 
+    reads = ('parts',)
+
     def body(self, term):
-        return any(x in term.parts for x in self.domain)
+        return bool(term.parts.mask & self.mask)
 
 
 class raw(UpadeshaFilter):
 
     """Filter on a term's raw value."""
 
+    reads = ('raw',)
+
     def body(self, term):
         return term.raw in self.domain
 
@@ -499,14 +751,18 @@ class samjna(SamjnaFilter):
 
     """Filter on a term's designations."""
 
+    reads = ('samjna',)
+
     def body(self, term):
-        return any(x in term.samjna for x in self.domain)
+        return bool(term.samjna.mask & self.mask)
 
 
 class upadha(AlFilter):
 
     """Filter on a term's penultimate sound."""
 
+    reads = ('value',)
+
     def body(self, term):
         return term.upadha in self.domain
 
@@ -515,15 +771,44 @@ class value(UpadeshaFilter):
 
     """Filter on a term's current value."""
 
+    reads = ('value',)
+
     def body(self, term):
         return term.value in self.domain
 
 
+_FilterCompiler.TEMPLATES.update({
+    adi: (2, 'term.adi in %s', frozenset),
+    al: (2, 'term.antya in %s', frozenset),
+    dhatu: (2, "(term.raw in %s and 'dhatu' in term.samjna)", frozenset),
+    lakshana: (1, 'term.lakshana.mask & %s', TAGS.mask),
+    part: (1, 'term.parts.mask & %s', TAGS.mask),
+    raw: (1, 'term.raw in %s', frozenset),
+    samjna: (1, 'term.samjna.mask & %s', TAGS.mask),
+    upadha: (2, 'term.upadha in %s', frozenset),
+    value: (1, 'term.value in %s', frozenset),
+})
+
+
 # Unparameterized filters
 # ~~~~~~~~~~~~~~~~~~~~~~~
 # Each function defines a filter body.
 
-@AlFilter.no_params
+class _RawAlFilter(AlFilter):
+
+    """An :class:`AlFilter` that reads only a term's raw value."""
+
+    reads = ('raw',)
+
+
+class _ValueAlFilter(AlFilter):
+
+    """An :class:`AlFilter` that reads only a term's current value."""
+
+    reads = ('value',)
+
+
+@_RawAlFilter.no_params
 def Sit_adi(term):
     """Filter on whether a term starts with ś in upadeśa."""
     return term.raw and term.raw[0] == 'S'
@@ -541,7 +826,7 @@ def allow_all(*args):
     return True
 
 
-@AlFilter.no_params
+@_ValueAlFilter.no_params
 def ekac(term):
     seen = False
     ac = Sounds('ac')
@@ -553,14 +838,14 @@ def ekac(term):
     return True
 
 
-@AlFilter.no_params
+@_ValueAlFilter.no_params
 def samyoga(term):
     """Filter on whether a term ends with a conjunct."""
     hal = Sounds('hal')
     return term.antya in hal and term.upadha in hal
 
 
-@AlFilter.no_params
+@_ValueAlFilter.no_params
 def samyogadi(term):
     """Filter on whether a term begins with a conjunct."""
     value = term.value
@@ -571,7 +856,7 @@ def samyogadi(term):
         return False
 
 
-@AlFilter.no_params
+@_ValueAlFilter.no_params
 def samyogapurva(term):
     """Filter on whether a term's final sound follows a conjunct."""
     value = term.value
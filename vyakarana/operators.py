@@ -15,6 +15,11 @@
 """
 
 from sounds import Sound, Sounds
+from util import LRUCache
+
+
+#: The default maximum size of :attr:`DataOperator.MEMO`.
+MEMO_SIZE = 10000
 
 conflicts = [
     ('dirgha', 'hrasva'),
@@ -25,6 +30,58 @@ conflicts = [
 ]
 
 
+#: Maps an *ik* vowel to its guṇa.
+#:
+#:     1.1.2 adeG guNaH
+#:     1.1.3 iko guNavRddhI
+#:     1.1.51 ur aN raparaH
+GUNA = dict(zip('iIuUfFxX', ['e', 'e', 'o', 'o', 'ar', 'ar', 'a', 'a']))
+
+#: Maps an *ik* vowel to its vṛddhi.
+#:
+#:     1.1.1 vRddhir Adaic
+#:     1.1.3 iko guNavRddhI
+#:     1.1.51 ur aN raparaH
+VRDDHI = dict(zip('iIuUfFxX', ['E', 'E', 'O', 'O', 'Ar', 'Ar', 'A', 'A']))
+
+#: Maps a short vowel to its long counterpart.
+DIRGHA = dict(zip('aiufx', 'AIUFX'))
+
+#: Maps a long vowel or diphthong to its short counterpart.
+HRASVA = dict(zip('AIUFXeEoO', 'aiufxiiuu'))
+
+AC = Sounds('ac')
+AN = Sounds('aR')
+YAN = Sounds('yaR')
+
+#: Maps a semivowel to its *saṃprasāraṇa*.
+#:
+#:     1.1.45 ig yaNaH saMprasAraNAm
+SAMPRASARANA = dict((L, Sound(L).closest('ifxu')) for L in YAN)
+
+
+def _replace_first(value, table):
+    """Replace the first sound in `value` that is a key in `table`.
+
+    :param value: some string
+    :param table: a dict that maps sounds to their replacements
+    """
+    for i, L in enumerate(value):
+        if L in table:
+            return value[:i] + table[L] + value[i + 1:]
+    return value
+
+
+def guna_value(value):
+    """Return `value` with its first *ik* vowel replaced by its guṇa."""
+    return _replace_first(value, GUNA)
+
+
+def vrddhi_value(value):
+    """Return `value` with its first *ik* vowel replaced by its vṛddhi."""
+    return _replace_first(value, VRDDHI)
+
+
 class Operator(object):
 
     """A callable class that returns states."""
@@ -148,20 +205,120 @@ class DataOperator(Operator):
 
     """An operator whose `body` modifies a term's data.
 
-    `body` accepts and returns a single string.
+    `body` accepts and returns a single string. Since `body` is usually
+    a pure function, its results can be shared by every derivation.
+    This is opt-in; see :meth:`enable_memo`.
+
+    If some operator's body is not pure, set its `pure` attribute to
+    ``False`` and it will never be memoized::
+
+        @DataOperator.no_params
+        def random_vowel(value):
+            ...
+
+        random_vowel.pure = False
     """
 
+    #: Maps ``(name, input)`` to the output of the operator called
+    #: `name` on `input`. If ``None``, nothing is memoized.
+    MEMO = None
+
+    #: Maps an operator name to a ``[calls, hits]`` pair. Calls are
+    #: counted only while :attr:`MEMO` is in use.
+    CALLS = {}
+
+    def __init__(self, *args, **kw):
+        Operator.__init__(self, *args, **kw)
+
+        #: If ``False``, `body` is not a pure function of its input,
+        #: and its results are never memoized.
+        self.pure = kw.get('pure', True)
+
+        # `name` keys :attr:`MEMO`, so it must identify the operation.
+        # Names like ``'ti(...)'`` don't.
+        self._named = not self.name.endswith('(...)')
+
     def apply(self, state, index, locus='value'):
         cur = state[index]
         _input = cur.value
         if not _input:
             return state
-        output = self.body(_input)
+
+        memo = DataOperator.MEMO
+        if memo is None:
+            output = self.body(_input)
+        else:
+            output = self._memo_body(memo, _input)
+
         if output != _input:
             return state.swap(index, cur.set_at(locus, output))
         else:
             return state
 
+    def _memo_body(self, memo, value):
+        """Return ``self.body(value)``, using `memo` if possible.
+
+        :param memo: the current :attr:`MEMO`
+        :param value: the input to `body`
+        """
+        name = self.name
+        try:
+            counts = DataOperator.CALLS[name]
+        except KeyError:
+            counts = DataOperator.CALLS[name] = [0, 0]
+        counts[0] += 1
+
+        if not (self.pure and self._named):
+            return self.body(value)
+
+        key = (name, value)
+        output = memo.get(key)
+        if output is None:
+            output = memo[key] = self.body(value)
+        else:
+            counts[1] += 1
+        return output
+
+    @classmethod
+    def enable_memo(cls, max_size=MEMO_SIZE):
+        """Memoize the results of every pure :class:`DataOperator`.
+
+        This replaces any existing memo and resets all counts.
+
+        :param max_size: the maximum number of results to keep. If
+                         ``None``, the memo is unbounded.
+        """
+        cls.MEMO = LRUCache(max_size)
+        cls.CALLS = {}
+
+    @classmethod
+    def disable_memo(cls):
+        """Stop memoizing and discard all stored results."""
+        cls.MEMO = None
+
+    @classmethod
+    def memo_stats(cls):
+        """Return a `dict` of statistics for :attr:`MEMO`.
+
+        ``'operators'`` maps each operator name to its number of calls,
+        number of hits, and hit rate.
+        """
+        if cls.MEMO is None:
+            returned = {'size': 0, 'max_size': None, 'hits': 0,
+                        'misses': 0, 'hit_rate': 0.0}
+        else:
+            returned = cls.MEMO.stats()
+
+        operators = {}
+        for name, (calls, hits) in cls.CALLS.iteritems():
+            operators[name] = {
+                'calls': calls,
+                'hits': hits,
+                'hit_rate': float(hits) / calls if calls else 0.0,
+            }
+        returned['operators'] = operators
+        return returned
+
 
 # Parameterized operators
 # ~~~~~~~~~~~~~~~~~~~~~~~
@@ -181,19 +338,16 @@ def adi(result):
 
 @DataOperator.parameterized
 def al_tasya(target, result):
-    target = Sounds(target)
     result = Sounds(result)
+    converter = {}
+    for L in Sounds(target):
+        converter[L] = Sound(L).closest(result)
+        # 1.1.51 ur aṇ raparaḥ
+        if L in 'fF' and converter[L] in AN:
+            converter[L] += 'r'
 
     def func(value):
-        letters = list(value)
-        for i, L in enumerate(letters):
-            if L in target:
-                letters[i] = Sound(L).closest(result)
-                # 1.1.51 ur aṇ raparaḥ
-                if L in 'fF' and letters[i] in Sounds('aR'):
-                    letters[i] += 'r'
-                break
-        return ''.join(letters)
+        return _replace_first(value, converter)
     return func
 
 
@@ -241,9 +395,8 @@ def tasya(sthani, adi=False):
 
         # 1.1.47 mid aco 'ntyāt paraḥ
         elif 'mit' in sthani.samjna:
-            ac = Sounds('ac')
             for i, L in enumerate(reversed(term_value)):
-                if L in ac:
+                if L in AC:
                     break
             new_value = term_value[:-i] + sthani.value + term_value[-i:]
             add_part = True
@@ -285,11 +438,9 @@ def ti(result):
 
     :param result: the replacement
     """
-    ac = Sounds('ac')
-
     def func(value):
         for i, L in enumerate(reversed(value)):
-            if L in ac:
+            if L in AC:
                 break
         return value[:-(i + 1)] + result
 
@@ -331,14 +482,7 @@ def yathasamkhya(targets, results):
 
 @DataOperator.no_params
 def dirgha(value):
-    converter = dict(zip('aiufx', 'AIUFX'))
-    letters = list(value)
-    for i, L in enumerate(letters):
-        if L in converter:
-            letters[i] = converter[L]
-            break
-
-    return ''.join(letters)
+    return _replace_first(value, DIRGHA)
 
 
 @Operator.no_params
@@ -355,29 +499,13 @@ def guna(state, index, locus=None):
 
     # 1.1.2 adeG guNaH
     # 1.1.3 iko guNavRddhI
-    converter = dict(zip('iIuUfFxX', 'eeooaaaa'))
-    letters = list(cur.value)
-    for i, L in enumerate(letters):
-        if L in converter:
-            letters[i] = converter[L]
-            if L in 'fF':
-                letters[i] += 'r'
-            break
-
-    cur = cur.set_value(''.join(letters)).add_samjna('guna')
+    cur = cur.set_value(guna_value(cur.value)).add_samjna('guna')
     return state.swap(index, cur)
 
 
 @DataOperator.no_params
 def hrasva(value):
-    converter = dict(zip('AIUFXeEoO', 'aiufxiiuu'))
-    letters = list(value)
-    for i, L in enumerate(letters):
-        if L in converter:
-            letters[i] = converter[L]
-            break
-
-    return ''.join(letters)
+    return _replace_first(value, HRASVA)
 
 
 @DataOperator.no_params
@@ -387,8 +515,8 @@ def samprasarana(value):
     for i, L in enumerate(rev_letters):
         # 1.1.45 ig yaNaH saMprasAraNAm
         # TODO: enforce short vowels automatically
-        if L in Sounds('yaR'):
-            rev_letters[i] = Sound(L).closest('ifxu')
+        if L in SAMPRASARANA:
+            rev_letters[i] = SAMPRASARANA[L]
             found = True
             break
 
@@ -398,7 +526,7 @@ def samprasarana(value):
     # 6.4.108 saMprasAraNAc ca
     try:
         L = rev_letters[i - 1]
-        if L in Sounds('ac'):
+        if L in AC:
             rev_letters[i - 1] = ''
     except IndexError:
         pass
@@ -421,30 +549,12 @@ def vrddhi(state, index, locus=None):
 
     # 1.1.1 vRddhir Adaic
     # 1.1.3 iko guNavRddhI
-    converter = dict(zip('iIuUfFxX', 'EEOOAAAA'))
-    letters = list(cur.value)
-    for i, L in enumerate(letters):
-        if L in converter:
-            letters[i] = converter[L]
-            if L in 'fF':
-                letters[i] += 'r'
-            break
-
-    cur = cur.set_value(''.join(letters))
+    cur = cur.set_value(vrddhi_value(cur.value))
     return state.swap(index, cur)
 
 
 @Operator.no_params
 def force_guna(state, index, locus=None):
     cur = state[index]
-    converter = dict(zip('iIuUfFxX', 'eeooaaaa'))
-    letters = list(cur.value)
-    for i, L in enumerate(letters):
-        if L in converter:
-            letters[i] = converter[L]
-            if L in 'fF':
-                letters[i] += 'r'
-            break
-
-    cur = cur.set_value(''.join(letters)).add_samjna('guna')
+    cur = cur.set_value(guna_value(cur.value)).add_samjna('guna')
     return state.swap(index, cur)
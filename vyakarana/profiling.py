@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+    vyakarana.profiling
+    ~~~~~~~~~~~~~~~~~~~
+
+    Counters for finding the rules and filters that cost the most.
+
+    Profiling is off by default and costs nothing while it's off. A
+    :class:`Profiler` works by replacing :meth:`Rule.apply
+    <vyakarana.rules.Rule.apply>`, :meth:`RuleTree.candidates
+    <vyakarana.trees.RuleTree.candidates>`, :meth:`RuleTree.select_cached
+    <vyakarana.trees.RuleTree.select_cached>`, and the ``allows`` method
+    of every filter class with counting versions, and by restoring the
+    originals once it's disabled. So while a profiler is enabled, it
+    counts every derivation in the process.
+
+    For each rule, we count how often it was:
+
+    - a *candidate*, i.e. selected by the rule tree and considered
+    - *tried*, i.e. applied to some state
+    - *productive*, i.e. applied and produced at least one state
+    - a *no-op*, i.e. applied but produced nothing, usually because
+      the operator left the state unchanged
+
+    and the total time spent in :meth:`~vyakarana.rules.Rule.apply`.
+    For each filter, we count its calls, how often it allowed the
+    term, and the total time spent in ``allows``.
+
+    Usage::
+
+        with Ashtadhyayi(profile=True) as ash:
+            set(ash.derive(...))
+        print ash.stats().report()
+
+    :license: MIT and BSD
+"""
+
+import json
+import timeit
+
+from filters import Filter, TermFilter
+from rules import Rule
+from trees import RuleTree
+
+timer = timeit.default_timer
+
+#: The fields counted for each rule, in report order.
+RULE_FIELDS = ['candidate', 'tried', 'produced', 'noop', 'time']
+
+#: The fields counted for each filter, in report order.
+FILTER_FIELDS = ['calls', 'allowed', 'time']
+
+
+class Stats(object):
+
+    """A snapshot of the counts collected by a :class:`Profiler`.
+
+    :param rules: maps a rule name to a dict of :data:`RULE_FIELDS`
+    :param filters: maps a filter name to a dict of
+                    :data:`FILTER_FIELDS`
+    :param select: a dict with the number of calls to
+                   :meth:`~vyakarana.trees.RuleTree.select_cached`
+                   and the total time spent in it
+    """
+
+    def __init__(self, rules, filters, select):
+        self.rules = rules
+        self.filters = filters
+        self.select = select
+
+    def __repr__(self):
+        return '<Stats(%s rules, %s filters)>' % (len(self.rules),
+                                                  len(self.filters))
+
+    def hot_rules(self, key='time', limit=None):
+        """Return ``(name, counts)`` pairs, most expensive first.
+
+        :param key: the field to sort by
+        :param limit: the maximum number of pairs to return
+        """
+        items = sorted(self.rules.iteritems(), key=lambda p: -p[1][key])
+        return items[:limit]
+
+    def hot_filters(self, key='time', limit=None):
+        """Return ``(name, counts)`` pairs, most expensive first.
+
+        :param key: the field to sort by
+        :param limit: the maximum number of pairs to return
+        """
+        items = sorted(self.filters.iteritems(), key=lambda p: -p[1][key])
+        return items[:limit]
+
+    def as_dict(self):
+        """Return all counts as plain, JSON-ready data."""
+        return {
+            'rules': self.rules,
+            'filters': self.filters,
+            'select': self.select,
+        }
+
+    def to_json(self, f=None, **kw):
+        """Return the counts as a JSON string, or write them to `f`.
+
+        :param f: a file-like object. If ``None``, return a string.
+        :param kw: extra arguments for :func:`json.dumps`
+        """
+        kw.setdefault('indent', 2)
+        kw.setdefault('sort_keys', True)
+        if f is None:
+            return json.dumps(self.as_dict(), **kw)
+        json.dump(self.as_dict(), f, **kw)
+
+    def report(self, limit=20, key='time'):
+        """Return a readable table of the most expensive rules and
+        filters.
+
+        :param limit: the number of rows in each table
+        :param key: the field to sort by. For filters, rule-only
+                    fields fall back to ``'time'``.
+        """
+        lines = []
+        lines.append('%-24s %9s %9s %9s %9s %10s' % (
+            'rule', 'candidate', 'tried', 'produced', 'noop', 'time (ms)'))
+        for name, c in self.hot_rules(key, limit):
+            lines.append('%-24s %9d %9d %9d %9d %10.2f' % (
+                name, c['candidate'], c['tried'], c['produced'],
+                c['noop'], c['time'] * 1000))
+
+        lines.append('')
+        filter_key = key if key in FILTER_FIELDS else 'time'
+        lines.append('%-40s %9s %9s %10s' % (
+            'filter', 'calls', 'allowed', 'time (ms)'))
+        for name, c in self.hot_filters(filter_key, limit):
+            lines.append('%-40s %9d %9d %10.2f' % (
+                name[:40], c['calls'], c['allowed'], c['time'] * 1000))
+
+        lines.append('')
+        lines.append('select: %d calls, %.2f ms' % (
+            self.select['calls'], self.select['time'] * 1000))
+        return '\n'.join(lines)
+
+    def pprint(self, limit=20, key='time'):
+        """Print :meth:`report`."""
+        print self.report(limit, key)
+
+
+class Profiler(object):
+
+    """Collects counts for rules, filters, and rule selection.
+
+    Only one profiler can be enabled at a time.
+    """
+
+    #: The profiler that is currently enabled, if any.
+    active = None
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Reset all counts."""
+        #: Maps a rule name to a list of counts, in the order of
+        #: :data:`RULE_FIELDS`.
+        self.rules = {}
+        #: Maps a filter name to a list of counts, in the order of
+        #: :data:`FILTER_FIELDS`.
+        self.filters = {}
+        #: ``[calls, time]`` for rule selection.
+        self.select = [0, 0.0]
+
+    @property
+    def enabled(self):
+        return Profiler.active is self
+
+    def enable(self):
+        """Start counting."""
+        if Profiler.active is self:
+            return
+        if Profiler.active is not None:
+            raise RuntimeError('Another profiler is already enabled.')
+        Profiler.active = self
+        for cls, name, make in _PATCHES:
+            setattr(cls, name, make(self, _ORIGINALS[cls, name]))
+
+    def disable(self):
+        """Stop counting and restore the original methods."""
+        if Profiler.active is not self:
+            return
+        for cls, name, make in _PATCHES:
+            setattr(cls, name, _ORIGINALS[cls, name])
+        Profiler.active = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def _rule_counts(self, rule):
+        try:
+            return self.rules[rule.name]
+        except KeyError:
+            counts = self.rules[rule.name] = [0, 0, 0, 0, 0.0]
+            return counts
+
+    def _filter_counts(self, filt):
+        try:
+            return self.filters[filt.name]
+        except KeyError:
+            counts = self.filters[filt.name] = [0, 0, 0.0]
+            return counts
+
+    def stats(self):
+        """Return a :class:`Stats` snapshot of the current counts."""
+        rules = dict((k, dict(zip(RULE_FIELDS, v)))
+                     for k, v in self.rules.iteritems())
+        filters = dict((k, dict(zip(FILTER_FIELDS, v)))
+                       for k, v in self.filters.iteritems())
+        select = {'calls': self.select[0], 'time': self.select[1]}
+        return Stats(rules, filters, select)
+
+
+# Instrumented methods
+# ~~~~~~~~~~~~~~~~~~~~
+# Each function accepts a profiler and the original method and returns
+# a counting version of that method.
+
+def _profile_apply(profiler, apply):
+    def profiled_apply(rule, state, index):
+        counts = profiler._rule_counts(rule)
+        start = timer()
+        results = list(apply(rule, state, index))
+        counts[4] += timer() - start
+        counts[1] += 1
+        if results:
+            counts[2] += 1
+        else:
+            counts[3] += 1
+        return iter(results)
+    return profiled_apply
+
+
+def _profile_candidates(profiler, candidates):
+    def profiled_candidates(tree, state):
+        for ra, ia in candidates(tree, state):
+            profiler._rule_counts(ra)[0] += 1
+            yield ra, ia
+    return profiled_candidates
+
+
+def _profile_select(profiler, select_cached):
+    def profiled_select(tree, state, index):
+        start = timer()
+        result = select_cached(tree, state, index)
+        profiler.select[0] += 1
+        profiler.select[1] += timer() - start
+        return result
+    return profiled_select
+
+
+def _profile_allows(profiler, allows):
+    def profiled_allows(filt, state, index):
+        counts = profiler._filter_counts(filt)
+        start = timer()
+        result = allows(filt, state, index)
+        counts[2] += timer() - start
+        counts[0] += 1
+        if result:
+            counts[1] += 1
+        return result
+    return profiled_allows
+
+
+#: ``(class, method name, factory)`` for each instrumented method.
+_PATCHES = [
+    (Rule, 'apply', _profile_apply),
+    (RuleTree, 'candidates', _profile_candidates),
+    (RuleTree, 'select_cached', _profile_select),
+    (Filter, 'allows', _profile_allows),
+    (TermFilter, 'allows', _profile_allows),
+]
+
+#: The original, uninstrumented methods.
+_ORIGINALS = dict(((cls, name), cls.__dict__[name])
+                  for cls, name, make in _PATCHES)
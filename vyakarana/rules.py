@@ -67,6 +67,11 @@ class Rule(object):
         #: Indicates whether or not the rule is optional
         self.optional = optional
 
+        #: The rule's position in the ranked list of rules. Rules with
+        #: a lower rank are tried first. This is set by
+        #: :class:`~vyakarana.trees.RuleTree`.
+        self.rank = None
+
         #: A list of rules. These rules are all blocked if the current
         #: rule can apply.
         self.utsarga = []
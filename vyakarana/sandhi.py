@@ -1,20 +1,24 @@
 import operators as O
-from derivations import State
-from sounds import Sound, Sounds
-from terms import Upadesha
+from sounds import ALPHABET, Sound, Sounds
 from util import SoundEditor
 
 
-def convert(op):
-    """A temporary fix to a deeper problem."""
-    def func(s):
-        return op.apply(State([Upadesha(s + 'a~')]), 0)[0].value
-    return func
-
 dirgha = O.dirgha.body
 iko_yan_aci = O.al_tasya('ik', 'yaR').body
-guna = convert(O.guna)
-vrddhi = convert(O.vrddhi)
+guna = O.guna_value
+vrddhi = O.vrddhi_value
+
+AC = Sounds('ac')
+HAL = Sounds('hal')
+AT_EN = Sounds('at eN')
+IK = Sounds('ik')
+IC = Sounds('ic')
+EC = Sounds('ec')
+V_Y = Sounds('v y')
+VAL = Sounds('val')
+
+#: 6.1.78 eco 'yavAyAvaH
+AYAVAYAVA = dict(zip('eEoO', 'ay Ay av Av'.split()))
 
 
 def apply(state):
@@ -24,15 +28,33 @@ def apply(state):
         if next.value is None:
             continue
 
-        x, y = cur.value, next.value
-        if x in Sounds('ac'):
-            cur.value, next.value = ac_sandhi(x, y)
-        elif x in Sounds('hal'):
-            cur.value, next.value = hal_sandhi(x, y)
+        key = (cur.value, next.value)
+        try:
+            cur.value, next.value = SANDHI[key]
+        except KeyError:
+            result = sandhi(*key)
+            if result is not None:
+                cur.value, next.value = result
 
     yield editor.join()
 
 
+def sandhi(x, y):
+    """Apply the rules of ac sandhi or hal sandhi to `x` as followed
+    by `y`.
+
+    :param x: the first letter.
+    :param y: the second letter.
+    :returns: a new ``(x, y)`` pair, or ``None`` if `x` is not a
+              single sound.
+    """
+    if x in AC:
+        return ac_sandhi(x, y)
+    elif x in HAL:
+        return hal_sandhi(x, y)
+    return None
+
+
 def ac_sandhi(x, y):
     """Apply the rules of ac sandhi to `x` as followed by `y`.
 
@@ -44,7 +66,7 @@ def ac_sandhi(x, y):
     """
 
     # 6.1.97 ato guNe
-    if x == 'a' and y in Sounds('at eN'):
+    if x == 'a' and y in AT_EN:
         x = ''
 
     # 6.1.101 akaH savarNe dIrghaH
@@ -53,20 +75,19 @@ def ac_sandhi(x, y):
         y = dirgha(y)
 
     # 6.1.77 iko yaN aci
-    elif x in Sounds('ik') and y in Sounds('ac'):
+    elif x in IK and y in AC:
         x = iko_yan_aci(x)
 
     # 6.1.78 eco 'yavAyAvaH
-    elif x in Sounds('ec') and y in Sounds('ac'):
-        converter = dict(zip('eEoO', 'ay Ay av Av'.split()))
-        x = converter[x]
+    elif x in EC and y in AC:
+        x = AYAVAYAVA[x]
 
-    elif x in 'aA' and y in Sounds('ic'):
+    elif x in 'aA' and y in IC:
         x = ''
 
         # 6.1.87 Ad guNaH
         # 6.1.88 vRddhir eci
-        y = vrddhi(y) if y in Sounds('ec') else guna(y)
+        y = vrddhi(y) if y in EC else guna(y)
 
     return x, y
 
@@ -82,7 +103,18 @@ def hal_sandhi(x, y):
     """
 
     # 6.1.66 lopo vyor vali
-    if x in Sounds('v y') and y in Sounds('val'):
+    if x in V_Y and y in VAL:
         x = ''
 
     return x, y
+
+
+#: The result of :func:`sandhi` for every pair of sounds. :func:`apply`
+#: falls back to :func:`sandhi` for anything else, e.g. a pair where
+#: one side was already changed into more than one sound.
+SANDHI = {}
+for _x in ALPHABET:
+    for _y in ALPHABET:
+        _result = sandhi(_x, _y)
+        if _result is not None:
+            SANDHI[_x, _y] = _result
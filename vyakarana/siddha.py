@@ -5,15 +5,7 @@
 
     Rules in the asiddha and asiddhavat sections of the Ashtadhyayi.
 
-    :license: MIT and BSD
-"""
-from sounds import Sounds, Sound, Pratyahara
-from terms import Upadesha
-from util import SoundEditor, SoundIndex
-
-
-def asiddha_helper(state):
-    """Chapter 8.2 of the Ashtadhyayi starts the 'asiddha' section of
+    Chapter 8.2 of the Ashtadhyayi starts the 'asiddha' section of
     the text:
 
         8.2.1 pUrvatrAsiddham
@@ -26,126 +18,385 @@ def asiddha_helper(state):
     abstract notion, but practically it means that these are the last
     rules we apply in a derivation.
 
-    :param state:
+    Here, each tripAdI rule is a :class:`SoundRule` that rewrites a
+    single sound in some context, and :class:`Tripadi` applies them.
+
+    :license: MIT and BSD
+"""
+from collections import namedtuple
+
+from sounds import Sounds, Sound, SoundCollection, Pratyahara
+
+
+# Sound groups used by the rules below.
+AW_KU_PU = Sounds('aw ku pu')
+CAR = Sounds('car')
+CAR_JAS = Sounds('car jaS')
+CU = Sounds('cu')
+HAL = Sounds('hal')
+IN_KU = Sounds('iN ku')
+IR = Pratyahara('iR', second_R=True)
+JAL = Sounds('Jal')
+JAS = Sounds('jaS')
+JAZ = Sounds('Jaz')
+JHAS = Sounds('JaS')
+KHAR = Sounds('Kar')
+KU = Sounds('ku')
+SCU = Sounds('S cu')
+STU = Sounds('s tu')
+VRASCADI = {'vraSc', 'Brasj', 'sfj', 'mfj', 'yaj', 'rAj', 'BrAj'}
+YAY = Sounds('yay')
+ZWU = Sounds('z wu')
+
+
+# Context flags
+# ~~~~~~~~~~~~~
+# Besides its neighbors, a rule can test these properties of a sound.
+
+#: The sound is the first sound of its term.
+FIRST = 1
+#: The sound is the last sound of its term.
+LAST = 2
+#: The sound's term is an abhyāsa.
+ABHYASA = 4
+#: The sound's term was derived from *liṭ*.
+LIT = 8
+#: The sound's term is a pratyaya or begins with *ṣ* in upadeśa.
+PRATYAYA_Z = 16
+#: The sound's term is one of the roots in 8.2.36 or ends in *ś* or *ch*.
+VRASCADI_ANGA = 32
+#: The previous sound belongs to *kṣubh*.
+AFTER_KZUBH = 64
+#: An *r*, *ṣ*, or *ṛ* precedes, with nothing but 8.4.2 sounds
+#: in between. This is set by :class:`Tripadi` as it moves along.
+AFTER_RZ = 128
+#: The sound was in *s* or *tu* just before 8.4.40 applied. This is
+#: set by :class:`Tripadi` while it applies the rules to the sound.
+STU_BEFORE = 256
+
+
+def _sounds(value):
+    """Return `value` as a frozenset of sounds, or ``None``."""
+    if value is None:
+        return None
+    if isinstance(value, SoundCollection):
+        return frozenset(value.values)
+    return frozenset(value)
+
+
+class SoundRule(namedtuple('SoundRule', ['name', 'left', 'target', 'right',
+                                         'replace', 'right2', 'when',
+                                         'unless', 'stop'])):
+
+    """A rule that rewrites one sound in some context.
+
+    :param name: the rule's name, e.g. ``'8.2.30'``
+    :param left: the sounds that must precede. The preceding sound is
+                 seen after any changes made to it.
+    :param target: the sounds the rule applies to
+    :param right: the sounds that must follow
+    :param replace: the replacement. This is one of:
+
+                    - a string, which replaces the sound. ``''``
+                      deletes it.
+                    - a :class:`~vyakarana.sounds.SoundCollection`.
+                      The sound is replaced by the closest sound in
+                      the collection.
+                    - a function of the sound and the following sound.
+                    - ``None``, which leaves the sound unchanged.
+    :param right2: the sounds that must follow `right`
+    :param when: flags that must all be set
+    :param unless: flags that must all be unset
+    :param stop: if ``True``, apply no more rules to this sound.
+
+    For `left`, `target`, `right`, and `right2`, ``None`` matches
+    anything.
+    """
+
+    def __new__(cls, name, left=None, target=None, right=None,
+                replace=None, right2=None, when=0, unless=0, stop=False):
+        return super(SoundRule, cls).__new__(
+            cls, name, _sounds(left), _sounds(target), _sounds(right),
+            replace, _sounds(right2), when, unless, stop)
+
+    def matches(self, w, x, y, z, flags):
+        """Return whether the rule applies to `x` in this context.
+
+        :param w: the previous sound
+        :param x: the current sound
+        :param y: the next sound
+        :param z: the sound after `y`
+        :param flags: the context flags for `x`
+        """
+        return ((self.target is None or x in self.target) and
+                (self.left is None or w in self.left) and
+                (self.right is None or y in self.right) and
+                (self.right2 is None or z in self.right2) and
+                flags & self.when == self.when and
+                not flags & self.unless)
+
+    def apply(self, x, y):
+        """Return the replacement for `x`.
+
+        :param x: the current sound
+        :param y: the next sound
+        """
+        replace = self.replace
+        if replace is None:
+            return x
+        if isinstance(replace, basestring):
+            return replace
+        if callable(replace):
+            return replace(x, y)
+        return Sound(x).closest(replace)
+
+
+def _parasavarna(x, y):
+    return Sound(x).closest(Sound(y).savarna_set)
+
+
+# 8.4.1 raSAbhyAM no NaH samAnapade
+# 8.4.2 aTkupvAGnuMvyavAye 'pi
+# According to commentary, 8.4.1 also applies to 'f' and 'F'.
+# TODO: AG, num
+#
+# Whether 8.4.1 applies depends on sounds that might be far away, so
+# :class:`Tripadi` tracks its context with the `AFTER_RZ` flag.
+NATVA = [SoundRule('8.4.1', target='n', when=AFTER_RZ, unless=AFTER_KZUBH,
+                   replace='R')]
+
+# 8.4.40 stoH zcunA zcuH
+# 8.4.44 zAt (na)
+#
+# 8.4.41 applies to the sounds that were in 'stu' before 8.4.40 changed
+# them, so :class:`Tripadi` records this with the `STU_BEFORE` flag.
+SCUTVA = [SoundRule('8.4.44', left='S', target=STU),
+          SoundRule('8.4.40', left=SCU, target=STU, replace=SCU),
+          SoundRule('8.4.40', target=STU, right=SCU, replace=SCU)]
+
+#: The tripAdI rules. Each item is a group of alternatives, and groups
+#: are tried in order. Within a group, the first matching rule applies
+#: and the others are skipped.
+RULES = [
+    # 8.2.29 skoH saMyogAdyor ante ca
+    # TODO: pada end
+    [SoundRule('8.2.29', target='sk', right=HAL, right2=JAL, replace='')],
+
+    # 8.2.30 coH kuH
+    # 8.2.31 ho DhaH
+    [SoundRule('8.2.30', target=CU, right=JAL.values - CU.values,
+               replace=KU),
+     SoundRule('8.2.31', target='h', right=JAL, replace='Q')],
+
+    # 8.2.36 vrazca-bhrasja-sRja-mRja-yaja-rAja-bhrAjacCazAM SaH
+    [SoundRule('8.2.36', right=JAL, when=LAST | VRASCADI_ANGA,
+               replace='z')],
+
+    # 8.2.40 (TODO: not dhA)
+    # 8.2.41 SaDhoH kaH si
+    [SoundRule('8.2.40', left=JAZ, target='tT', replace='D'),
+     SoundRule('8.2.40', target='D', right='tT', stop=True),
+     SoundRule('8.2.41', target='zQ', right='s', replace='k')],
+
+    # 8.3.23 mo 'nusvAraH
+    # 8.3.24 naz cApadAntasya jhali
+    [SoundRule('8.3.24', target='mn', right=JAL, replace='M')],
+
+    # 8.3.59 AdezapratyayayoH
+    [SoundRule('8.3.59', left=IN_KU, target='s', when=PRATYAYA_Z,
+               unless=LAST, replace='z')],
+
+    # 8.3.78 iNaH SIdhvaMluGliTAM dho 'GgAt
+    # 8.3.79 vibhASeTaH
+    # TODO: SIdhvam, luG
+    [SoundRule('8.3.78', left=IR, target='D', when=FIRST | LIT,
+               replace='Q')],
+
+    NATVA,
+
+    SCUTVA,
+
+    # 8.4.41 STunA STuH
+    [SoundRule('8.4.41', left=ZWU, when=STU_BEFORE, replace=ZWU),
+     SoundRule('8.4.41', right=ZWU, when=STU_BEFORE, replace=ZWU)],
+
+    # 8.4.55 khari ca
+    # 8.4.54 abhyAse car ca
+    # 8.4.53 jhalAM jaz jhazi
+    [SoundRule('8.4.55', target=JAL, right=KHAR, replace=CAR),
+     SoundRule('8.4.54', target=JAL, when=ABHYASA | FIRST, replace=CAR_JAS),
+     SoundRule('8.4.53', target=JAL, right=JHAS, replace=JAS)],
+
+    # 8.4.58 anusvArasya yayi parasavarNaH
+    [SoundRule('8.4.58', target='M', right=YAY, replace=_parasavarna)],
+]
+
+#: The sounds that start the 8.4.1 context.
+RZ = frozenset('rzfF')
+
+#: The sounds that continue the 8.4.1 context.
+AW_KU_PU_SET = frozenset(AW_KU_PU.values)
+
+#: The sounds that 8.4.40 and 8.4.41 apply to.
+STU_SET = frozenset(STU.values)
+
+
+class Tripadi(object):
+
+    """Applies the tripAdI rules to a state.
+
+    The sounds of a state are processed in a single left-to-right pass.
+    The result for each sound depends only on its neighbors and its
+    flags, so results are stored in a transition table and each sound
+    usually costs a single lookup.
+
+    Since rules look at the *next* sounds as they were before the pass,
+    one pass might enable another. So passes are repeated until nothing
+    changes. But a sound can change only if some sound at most two
+    places after it changed, so each new pass starts just before the
+    first sound that changed in the last one.
+
+    :param rules: a list of rule groups. See :data:`RULES`.
     """
 
-    had_rs = False
-
-    editor = SoundEditor(state)
-    for c in editor:
-        p = c.prev
-        n = c.next
-        n2 = n.next
-
-        w, x, y, z = (p.value, c.value, n.value, n2.value)
-
-        # 8.2.29 skoH saMyogAdyor ante ca
-        # TODO: pada end
-        if x in 'sk' and y in Sounds('hal') and z in Sounds('Jal'):
-            x = '_'
-
-        if y in Sounds('Jal'):
-            # 8.2.30 coH kuH
-            cu = Sounds('cu')
-            if x in cu and y in Sounds('Jal') and y not in cu:
-                x = Sound(x).closest(Sounds('ku'))
-
-            # 8.2.31 ho DhaH
-            elif x == 'h':
-                x = 'Q'
-
-            # 8.2.36 vrazca-bhrasja-sRja-mRja-yaja-rAja-bhrAjacCazAM SaH
-            roots = {'vraSc', 'Brasj', 'sfj', 'mfj', 'yaj', 'rAj', 'BrAj'}
-            if c.last and (c.term.value in roots or c.term.antya in 'SC'):
-                x = 'z'
-
-        # 8.2.40 (TODO: not dhA)
-        if w in Sounds('Jaz') and x in 'tT':
-            x = 'D'
-        elif x == 'D' and y in 'tT':
-            continue
-
-         # 8.2.41 SaDhoH kaH si
-        elif x in 'zQ' and y == 's':
-            x = 'k'
-
-        # 8.2.41 SaDhoH kaH si
-        if x in 'zQ' and y == 's':
-            x = 'k'
-
-        # 8.3.23 mo 'nusvAraH
-        # elif x == 'm' and y in Sounds('hal'):
-        #     x = 'M'
-
-        # 8.3.24 naz cApadAntasya jhali
-        elif x in 'mn' and y in Sounds('Jal'):
-            x = 'M'
-
-        # 8.3.59 AdezapratyayayoH
-        if w in Sounds('iN ku'):
-            if not c.last and x == 's' and (c.term.raw[0] == 'z'
-                                            or 'pratyaya' in c.term.samjna):
-                x = 'z'
-
-        # 8.3.78 iNaH SIdhvaMluGliTAM dho 'GgAt
-        # 8.3.79 vibhASeTaH
-        # TODO: SIdhvam, luG
-        if (x == 'D'
-                and w in Pratyahara('iR', second_R=True)
-                and c.first  # not triggered by iT
-                and 'li~w' in c.term.lakshana):
-            x = 'Q'
-
-        # 8.4.1 raSAbhyAM no NaH samAnapade
-        # 8.4.2 aTkupvAGnuMvyavAye 'pi
-        # According to commentary, 8.4.1 also applies to 'f' and 'F'.
-        # TODO: AG, num
-        if x in 'rzfF':
-            had_rs = True
-        elif x == 'n' and had_rs and p.term.value != 'kzuB':
-            x = 'R'
-            had_rs = False
-        elif x not in Sounds('aw ku pu'):
-            had_rs = False
-
-        stu = Sounds('s tu')
-        if x in stu:
-
-            # 8.4.40 stoH zcunA zcuH
-            # 8.4.44 zAt (na)
-            scu = Sounds('S cu')
-            if w == 'S':
-                pass
-            elif w in scu or y in scu:
-                x = Sound(x).closest(scu)
-
-            # 8.4.41 STunA STuH
-            zwu = Sounds('z wu')
-            if w in zwu or y in zwu:
-                x = Sound(x).closest(zwu)
-
-        if x in Sounds('Jal'):
-            x_ = x
-
-            # 8.4.53 jhalAM jaz jhazi
-            if y in Sounds('JaS'):
-                x = Sound(x_).closest(Sounds('jaS'))
-
-            # 8.4.54 abhyAse car ca
-            if 'abhyasa' in c.term.samjna and c.first:
-                x = Sound(x_).closest(Sounds('car jaS'))
-
-            # 8.4.55 khari ca
-            if y in Sounds('Kar'):
-                x = Sound(x_).closest(Sounds('car'))
-
-        # 8.4.58 anusvArasya yayi parasavarNaH
-        if x == 'M' and y in Sounds('yay'):
-            x = Sound(x).closest(Sound(y).savarna_set)
-
-        c.value = x if x != '_' else ''
-
-    yield editor.join()
+    def __init__(self, rules=RULES):
+        self.rules = rules
+        #: Maps (w, x, y, z, flags) to (new x, whether the 8.4.1
+        #: context continues after x).
+        self.table = {}
+
+    def transition(self, w, x, y, z, flags):
+        """Apply the rules to a single sound.
+
+        This returns a 2-tuple of the new sound and whether the 8.4.1
+        context continues after it.
+
+        :param w: the previous sound, after any changes
+        :param x: the current sound
+        :param y: the next sound
+        :param z: the sound after `y`
+        :param flags: the context flags for `x`
+        """
+        key = (w, x, y, z, flags)
+        try:
+            return self.table[key]
+        except KeyError:
+            pass
+
+        after_rz = bool(flags & AFTER_RZ)
+        for group in self.rules:
+            if group is SCUTVA and x in STU_SET:
+                flags |= STU_BEFORE
+
+            rule = None
+            for r in group:
+                if r.matches(w, x, y, z, flags):
+                    rule = r
+                    break
+
+            if group is NATVA:
+                if rule is not None:
+                    after_rz = False
+                elif x in RZ:
+                    after_rz = True
+                elif x not in AW_KU_PU_SET:
+                    after_rz = False
+
+            if rule is not None:
+                if rule.stop:
+                    break
+                x = rule.apply(x, y)
+
+        result = self.table[key] = (x, after_rz)
+        return result
+
+    def apply(self, state):
+        """Apply the tripAdI rules to `state` and return the result.
+
+        :param state: a :class:`~vyakarana.derivations.State`
+        """
+        values = [t.asiddha for t in state]
+        start = 0
+        after = []
+
+        while True:
+            sounds, owners, static = self._flatten(state, values)
+            n = len(sounds)
+
+            # Sounds before `start` are unchanged from the last pass.
+            results = sounds[:start]
+            after = after[:start]
+            w = results[-1] if start else None
+            after_rz = after[-1] if start else False
+            changed = None
+
+            for k in xrange(start, n):
+                x = sounds[k]
+                y = sounds[k + 1] if k + 1 < n else None
+                z = sounds[k + 2] if k + 2 < n else None
+                flags = static[k] | AFTER_RZ if after_rz else static[k]
+                w, after_rz = self.transition(w, x, y, z, flags)
+                after.append(after_rz)
+                results.append(w)
+                if changed is None and w != x:
+                    changed = k
+
+            if changed is None:
+                break
+
+            values = [''] * len(values)
+            for owner, x in zip(owners, results):
+                values[owner] += x
+            start = max(0, changed - 2)
+
+        returned = state
+        for i, term in enumerate(state):
+            if values[i] != term.asiddha:
+                returned = returned.swap(i, term.set_asiddha(values[i]))
+        return returned
+
+    def _flatten(self, state, values):
+        """Return the sounds in `values` with their terms and flags.
+
+        :param state: the original state
+        :param values: the current asiddha value of each term
+        """
+        sounds = []
+        owners = []
+        static = []
+        prev_term = None
+        for i, term in enumerate(state):
+            value = values[i]
+            if not value:
+                continue
+
+            term_flags = 0
+            if 'abhyasa' in term.samjna:
+                term_flags |= ABHYASA
+            if 'li~w' in term.lakshana:
+                term_flags |= LIT
+            if term.raw[:1] == 'z' or 'pratyaya' in term.samjna:
+                term_flags |= PRATYAYA_Z
+            if term.value in VRASCADI or term.antya in ('S', 'C'):
+                term_flags |= VRASCADI_ANGA
+            last = len(term.value) - 1
+
+            for j, x in enumerate(value):
+                flags = term_flags
+                if j == 0:
+                    flags |= FIRST
+                if j == last:
+                    flags |= LAST
+                if prev_term is not None and prev_term.value == 'kzuB':
+                    flags |= AFTER_KZUBH
+                sounds.append(x)
+                owners.append(i)
+                static.append(flags)
+                prev_term = term
+        return sounds, owners, static
+
+
+TRIPADI = Tripadi()
 
 
 def asiddhavat(state):
@@ -160,13 +411,8 @@ def asiddhavat(state):
 
 
 def asiddha(state):
-    state_value, result_value = (''.join(x.asiddha for x in state), None)
-    for result in asiddha_helper(state):
-        result_value = ''.join(x.asiddha for x in result)
-        if result_value == state_value:
-            yield state
-            return
-        else:
-            for x in asiddha(result):
-                yield x
-                return
+    """Apply the tripAdI rules to `state` and yield the result.
+
+    :param state: a :class:`~vyakarana.derivations.State`
+    """
+    yield TRIPADI.apply(state)
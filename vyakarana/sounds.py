@@ -9,15 +9,21 @@
 """
 
 
+import lists
+
+
 def memoize(c):
     cache = {}
-    get_key = lambda a, kw: tuple(a) + (frozenset(kw.items()),)
 
     def memoized(*a, **kw):
-        key = get_key(a, kw)
-        if key not in cache:
-            cache[key] = c(*a, **kw)
-        return cache[key]
+        # Most calls have no keywords, so use the bare arguments as a
+        # key and skip building a frozenset.
+        key = a + (frozenset(kw.items()),) if kw else a
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = c(*a, **kw)
+            return value
     return memoized
 
 
@@ -98,25 +104,20 @@ class Sound(object):
 
         :param other:
         """
-        ac = Pratyahara('ac')
-        same_ac = self.value in ac and other in ac
+        same_ac = self.value in AC and other in AC
         return same_ac and other not in self.savarna_set
 
     def closest(self, items):
         """Return the phonetically closest value. If no close value
         exists, return `self.value`.
 
-        :param items: a list of letters
+        :param items: a list of letters. If this is a
+                      :class:`SoundCollection`, the result is looked up
+                      in the collection's precomputed table.
         """
-        best = self.value
-        best_score = 0
-
-        self_names = self.names()
-        for x in items:
-            score = len(Sound(x).names().intersection(self_names))
-            if score > best_score:
-                best, best_score = x, score
-        return best
+        if isinstance(items, SoundCollection):
+            return items.closest_to(self.value)
+        return _closest(self.value, items)
 
     def names(self):
         """Get the various designations that apply to this sound. This
@@ -152,6 +153,12 @@ class Sound(object):
             1.1.9  tulyAsyaprayatnaM savarNam
             1.1.10 nAjjhalau
         """
+        try:
+            return SAVARNA[self.value]
+        except KeyError:
+            return self._make_savarna_set()
+
+    def _make_savarna_set(self):
         s = self.value
         a = p = None
 
@@ -193,6 +200,25 @@ class SoundCollection(object):
     def __repr__(self):
         return "<%s('%s')>" % (self.__class__.__name__, self.name)
 
+    def closest_to(self, value):
+        """Return the sound in this collection that is phonetically
+        closest to `value`. If no close sound exists, return `value`.
+
+        Results are stored in a table, so each lookup is computed just
+        once per collection.
+
+        :param value: some sound
+        """
+        try:
+            table = self._closest_table
+        except AttributeError:
+            table = self._closest_table = {}
+        try:
+            return table[value]
+        except KeyError:
+            result = table[value] = _closest(value, self.values)
+            return result
+
 
 @memoize
 class Sounds(SoundCollection):
@@ -279,3 +305,57 @@ class Pratyahara(SoundCollection):
                     second_R = False
                 else:
                     break
+
+
+def _closest(value, items):
+    """Return the item in `items` that is phonetically closest to
+    `value`. If no close item exists, return `value`.
+
+    Ties go to the earliest item.
+
+    :param value: some sound
+    :param items: an iterable of sounds
+    """
+    best = value
+    best_score = 0
+    scores = SIMILARITY.get(value, {})
+    for x in items:
+        score = scores.get(x, 0)
+        if score > best_score:
+            best, best_score = x, score
+    return best
+
+
+# Feature tables
+# ~~~~~~~~~~~~~~
+# These are computed once when the module loads, so that the lookups
+# above are just dictionary accesses. `Sound` is memoized, so its
+# feature groups are read from an instance.
+
+_features = Sound('a')
+
+#: Every sound that has some articulatory feature.
+ALPHABET = sorted(set().union(*(_features.ASYA + _features.PRAYATNA +
+                                _features.NASIKA + _features.GHOSA +
+                                _features.PRANA)))
+
+#: The vowels.
+AC = Pratyahara('ac')
+
+#: Maps a sound to the sounds that are savarna to it.
+SAVARNA = dict((x, frozenset(Sound(x)._make_savarna_set()))
+               for x in ALPHABET)
+
+#: Maps two sounds to the number of features they share. This is how
+#: :meth:`Sound.closest` measures similarity.
+SIMILARITY = dict((x, dict((y, len(Sound(x).names() & Sound(y).names()))
+                           for y in ALPHABET))
+                  for x in ALPHABET)
+
+# Fill in the closest-sound table for every collection used by the
+# grammar.
+for _name in lists.SOUNDS:
+    _collection = Sounds(_name)
+    for _x in ALPHABET:
+        _collection.closest_to(_x)
+del _features, _name, _collection, _x
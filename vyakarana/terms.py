@@ -9,9 +9,12 @@
 """
 
 import re
+import weakref
 from collections import namedtuple
 
+import lists
 from sounds import Sounds
+from util import BitRegistry
 
 
 _DataSpace = namedtuple('_DataSpace',
@@ -31,11 +34,107 @@ class DataSpace(_DataSpace):
         return self._replace(**new)
 
 
+#: Assigns a bit to each saṃjñā, 'it' marker, lakṣaṇa, and augment.
+#: Known values are registered up front and others as they're seen.
+#: Saṃjñā are tested most often, so they get the lowest bits; masks
+#: that fit in a machine word are cheaper to work with.
+TAGS = BitRegistry(sorted(lists.SAMJNA | lists.IT) + sorted(lists.LA))
+
+
+class Tags(frozenset):
+
+    """An immutable set of tags that also stores their bitmask.
+
+    Tags behave like any other `frozenset`, but a filter can test for
+    any of several tags with a single AND, and adding tags that are
+    already present is a single OR and compare. Bits come from
+    :data:`TAGS`.
+
+    :param values: the tags in the set
+    :param mask: the bitmask of `values`, if already known
+    """
+
+    __slots__ = ['mask']
+
+    def __new__(cls, values=(), mask=None):
+        self = frozenset.__new__(cls, values)
+        self.mask = TAGS.mask(self) if mask is None else mask
+        return self
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def difference(self, *others):
+        mask = self.mask
+        for other in others:
+            mask &= ~_mask(other)
+        if mask == self.mask:
+            return self
+        return Tags(frozenset.difference(self, *others), mask)
+
+    def union(self, *others):
+        mask = self.mask
+        for other in others:
+            mask |= _mask(other)
+        if mask == self.mask:
+            return self
+        return Tags(frozenset.union(self, *others), mask)
+
+
+def _mask(values):
+    """Return the bitmask for a collection of tags."""
+    if isinstance(values, Tags):
+        return values.mask
+    return TAGS.mask(values)
+
+
+#: Maps the full contents of a term to the one live term with those
+#: contents. See :meth:`Upadesha._intern`.
+_INTERNED = weakref.WeakValueDictionary()
+
+
+def _frozen(value):
+    """Return an immutable version of `value`."""
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def _tags(value):
+    """Return a :class:`Tags` version of `value`."""
+    if isinstance(value, (set, frozenset)) and not isinstance(value, Tags):
+        return Tags(value)
+    return value
+
+
+class _Interned(type):
+
+    """Metaclass that interns every term once it's fully initialized.
+
+    Subclasses modify the term in their own `__init__`, so interning
+    must wait until the whole constructor has run.
+    """
+
+    def __call__(cls, *a, **kw):
+        return type.__call__(cls, *a, **kw)._intern()
+
+
 class Upadesha(object):
 
-    """A term with indicatory letters."""
+    """A term with indicatory letters.
+
+    Terms are hash-consed: two terms with the same contents are the
+    same object. So equality is just identity, the hash is computed
+    once, and equal terms share a single filter cache.
+    """
 
-    __slots__ = ['data', 'samjna', 'lakshana', 'ops', 'parts', '_filter_cache']
+    __metaclass__ = _Interned
+
+    __slots__ = ['data', 'samjna', 'lakshana', 'ops', 'parts', '_filter_cache',
+                 '_content_key', '_key', '_hash', '__weakref__']
     nasal_re = re.compile('([aAiIuUfFxeEoO])~')
 
     def __init__(self, raw=None, **kw):
@@ -81,19 +180,13 @@ class Upadesha(object):
         self._filter_cache = {}
 
     def __eq__(self, other):
-        if self is other:
-            return True
-        if other is None:
-            return False
-        return (self.__class__ == other.__class__ and
-                self.data == other.data and
-                self.samjna == other.samjna and
-                self.lakshana == other.lakshana and
-                self.ops == other.ops and
-                self.parts == other.parts)
+        return self is other
 
     def __ne__(self, other):
-        return not self == other
+        return self is not other
+
+    def __hash__(self):
+        return self._hash
 
     def __repr__(self):
         return "<%s('%s')>" % (self.__class__.__name__, self.value)
@@ -105,6 +198,43 @@ class Upadesha(object):
 
         return self.__class__(**kw)
 
+    def fingerprint(self, ops=True):
+        """Return a hashable value that identifies this term.
+
+        Two terms have the same fingerprint if and only if they are
+        equal.
+
+        :param ops: if ``False``, ignore `ops`. Filters never look at
+                    `ops`, so this is enough to identify a term for
+                    the purposes of rule selection.
+        """
+        if ops:
+            return self._key
+        return self._content_key
+
+    def _intern(self):
+        """Return the canonical term with this term's contents.
+
+        If there's no such term yet, this term becomes the canonical
+        one. Its sets are frozen first, since other code might share it.
+        """
+        self.samjna = _tags(self.samjna)
+        self.lakshana = _tags(self.lakshana)
+        self.ops = _frozen(self.ops)
+        self.parts = _tags(self.parts)
+
+        content_key = (self.__class__, self.data, self.samjna,
+                       self.lakshana, self.parts)
+        key = content_key + (self.ops,)
+        try:
+            return _INTERNED[key]
+        except KeyError:
+            self._content_key = content_key
+            self._key = key
+            self._hash = hash(key)
+            _INTERNED[key] = self
+            return self
+
     @staticmethod
     def as_anga(*a, **kw):
         """Create the upadesha then mark it as an ``'anga'``."""
@@ -364,7 +494,7 @@ class Pratyaya(Upadesha):
 
     def __init__(self, *a, **kw):
         Upadesha.__init__(self, *a, **kw)
-        self.samjna |= set(['pratyaya'])
+        self.samjna = self.samjna | set(['pratyaya'])
 
         # 1.1.__ pratyayasya lukzlulupaH
         if self.value in ('lu~k', 'Slu~', 'lu~p'):
@@ -380,14 +510,14 @@ class Krt(Pratyaya):
 
     def __init__(self, *a, **kw):
         Pratyaya.__init__(self, *a, **kw)
-        self.samjna |= set(['krt'])
+        self.samjna = self.samjna | set(['krt'])
 
         # 3.4.113 tiGzit sArvadhAtukam
         # 3.4.115 liT ca (ArdhadhAtukam)
         if 'Sit' in self.samjna and self.raw != 'li~w':
-            self.samjna |= set(['sarvadhatuka'])
+            self.samjna = self.samjna | set(['sarvadhatuka'])
         else:
-            self.samjna |= set(['ardhadhatuka'])
+            self.samjna = self.samjna | set(['ardhadhatuka'])
 
 
 class Vibhakti(Pratyaya):
@@ -396,7 +526,7 @@ class Vibhakti(Pratyaya):
 
     def __init__(self, *a, **kw):
         Pratyaya.__init__(self, *a, **kw)
-        self.samjna |= set(['vibhakti'])
+        self.samjna = self.samjna | set(['vibhakti'])
 
     def _parse_it(self, value):
         return Upadesha._parse_it(self, value, pratyaya=True, vibhakti=True)
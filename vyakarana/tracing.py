@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    vyakarana.tracing
+    ~~~~~~~~~~~~~~~~~
+
+    Trace sinks for following a derivation step by step.
+
+    Tracing is off by default. To turn it on, pass a sink to
+    :class:`~vyakarana.ashtadhyayi.Ashtadhyayi` or to
+    :meth:`~vyakarana.ashtadhyayi.Ashtadhyayi.derive`. A sink is any
+    callable with the signature ``sink(event, *args)``. These events
+    are sent:
+
+    ==========  ===================================================
+    Event       Arguments
+    ==========  ===================================================
+    ``start``   the starting state
+    ``apply``   the rule, the index, the old state, and the new state
+    ``yield``   the final state and the result string
+    ==========  ===================================================
+
+    Sinks receive the original objects, so nothing is formatted unless
+    the sink formats it.
+
+    :license: MIT and BSD
+"""
+
+import logging
+
+from . import logger
+
+
+class Collector(object):
+
+    """A sink that stores every event as a tuple."""
+
+    def __init__(self):
+        #: A list of ``(event, arg1, arg2, ...)`` tuples.
+        self.events = []
+
+    def __call__(self, event, *args):
+        self.events.append((event,) + args)
+
+    def clear(self):
+        self.events = []
+
+    def rules(self):
+        """Return the names of the rules applied, in order."""
+        return [e[1].name for e in self.events if e[0] == 'apply']
+
+
+class LogTrace(object):
+
+    """A sink that writes events to the ``vyakarana`` logger.
+
+    Messages are formatted by the logging module, so they cost nothing
+    if the logger ignores them.
+
+    :param level: the log level to use
+    """
+
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def __call__(self, event, *args):
+        log = logger.log
+        if event == 'apply':
+            rule, index, old, new = args
+            log(self.level, '  %s : %s --> %s', rule.name, old, new)
+        elif event == 'start':
+            log(self.level, '---')
+            log(self.level, 'start: %s', args[0])
+        elif event == 'yield':
+            log(self.level, 'yield: %s', args[1])
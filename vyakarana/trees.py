@@ -8,32 +8,54 @@
     :license: MIT and BSD
 """
 
-import itertools
+import cPickle as pickle
+import hashlib
+import heapq
+import os
 from collections import defaultdict
+from operator import attrgetter
 
+import operators as O
+from dhatupatha import DHATUPATHA_CSV
+from filters import TermFilter
 from templates import *
+from util import atomic_open
+
+#: Bump this whenever the format of :meth:`RuleTree.to_data` changes.
+DATA_VERSION = 1
 
 
 def find_apavada_rules(rules):
     """Find all utsarga-apavāda relationships in the given rules.
 
+    Comparing every pair of rules is quadratic, so we use a
+    :class:`ConflictIndex` to compare only the pairs that could
+    plausibly be in conflict.
+
     :param rules: a list of rules
     :returns: a `dict` that maps a rule to its apavāda rules.
     """
     apavadas = defaultdict(set)
+    index = ConflictIndex(rules)
+
+    by_operator = defaultdict(list)
+    for rule in rules:
+        by_operator[rule.operator.name].append(rule)
+
     for i, rule in enumerate(rules):
         # 'na' negates an operator, so we can just match on operators.
         if rule.modifier == Na:
-            for other in rules:
+            for other in by_operator[rule.operator.name]:
                 if (rule.operator == other.operator and rule != other):
                     apavadas[other].add(rule)
         else:
+            indices = index.candidates(rule)
             # For a śeṣa rule, an apavāda comes before the rule:
             if rule.modifier == Shesha:
-                rule_slice = itertools.islice(rules, 0, i)
+                rule_slice = (rules[j] for j in indices if j < i)
             # But generally, an apavāda comes after the rule:
             else:
-                rule_slice = itertools.islice(rules, i, None)
+                rule_slice = (rules[j] for j in indices if j >= i)
 
             new_apavadas = (r for r in rule_slice if rule.has_apavada(r))
             apavadas[rule].update(new_apavadas)
@@ -41,6 +63,118 @@ def find_apavada_rules(rules):
     return apavadas
 
 
+class ConflictIndex(object):
+
+    """An index for finding the rules that might be apavādas of a rule.
+
+    Rule B can be an apavāda to rule A only if all of the following
+    hold (see :meth:`~vyakarana.rules.Rule.has_apavada`):
+
+    - A and B have the same locus.
+    - A and B have operators in the same conflict class, as defined in
+      :data:`vyakarana.operators.conflicts`.
+    - At each position, B's filter is a subset of A's filter. This is
+      possible only if B's filter has a superset of the same category
+      as each of A's supersets. ("Or" supersets are skipped, since
+      any filter in their domain is enough.)
+
+    This class indexes rules on all three properties. The candidates
+    it returns are a superset of the true apavādas.
+
+    :param rules: a list of rules
+    """
+
+    def __init__(self, rules):
+        #: Maps (locus, conflict class) to a set of rule indices.
+        self.buckets = defaultdict(set)
+        #: Maps (position, category) to the indices of the rules that
+        #: have a superset with that category at that position.
+        self.providers = defaultdict(set)
+        #: The number of filters in each rule.
+        self.lengths = [len(r.filters) for r in rules]
+
+        for j, rule in enumerate(rules):
+            for c in _conflict_classes(rule.operator):
+                self.buckets[(rule.locus, c)].add(j)
+            for k, filt in enumerate(rule.filters):
+                for s in filt.supersets:
+                    self.providers[(k, s.category)].add(j)
+
+    def candidates(self, rule):
+        """Return the indices of the rules that might be apavādas.
+
+        :param rule: a rule
+        """
+        returned = set()
+        for c in _conflict_classes(rule.operator):
+            returned.update(self.buckets[(rule.locus, c)])
+
+        lengths = self.lengths
+        for k, filt in enumerate(rule.filters):
+            for category in set(s.category for s in filt.supersets):
+                if category == 'or' or not returned:
+                    continue
+
+                # Filters are compared pairwise, so positions past the
+                # end of the other rule are never checked.
+                providers = self.providers[(k, category)]
+                returned = set(j for j in returned
+                               if j in providers or lengths[j] <= k)
+        return sorted(returned)
+
+
+def _conflict_classes(operator):
+    """Return the conflict classes that contain `operator`.
+
+    :param operator: an operator
+    """
+    return [i for i, c in enumerate(O.conflicts) if operator.category in c]
+
+
+def source_digest():
+    """Return a digest of the code that defines the rules.
+
+    This covers every module in the package, including the adhyāya and
+    pada modules, since the filters, operators, and rankers they use
+    also affect the final tree. It also covers the Dhātupāṭha, which
+    defines the domains of many filters.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames)
+                     if f.endswith('.py'))
+    paths.append(DHATUPATHA_CSV)
+
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.relpath(path, root))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+_by_rank = attrgetter('rank')
+
+
+def _ranked_pairs(selection, index):
+    """Yield (rank, index, rule) for each rule in a ranked selection."""
+    for rule in selection:
+        yield rule.rank, index, rule
+
+
+def _link_apavadas(pairs):
+    """Record utsarga-apavāda relationships on the rules themselves.
+
+    :param pairs: an iterable of (rule, apavādas) pairs
+    """
+    for rule, values in pairs:
+        rule.apavada = values
+        for a in values:
+            a.utsarga.append(rule)
+
+
 class RuleTree(object):
 
     """A hierarchical arrangment of rules.
@@ -59,12 +193,8 @@ class RuleTree(object):
     def __init__(self, rules, ranker=None, used_features=None):
         # HACK
         if ranker is not None:
-            self.ranked_rules = sorted(rules, key=ranker, reverse=True)
-            apavadas = find_apavada_rules(rules)
-            for rule, values in apavadas.iteritems():
-                rule.apavada = values
-                for a in values:
-                    a.utsarga.append(rule)
+            self._set_ranked_rules(sorted(rules, key=ranker, reverse=True))
+            _link_apavadas(find_apavada_rules(rules).iteritems())
 
         #: A list of rules that could not be subdivided any further.
         #: This is usually because the rule is unspecified in some way.
@@ -99,6 +229,111 @@ class RuleTree(object):
             self.features[feat] = subtree
             seen.update(rule_list)
 
+    @classmethod
+    def from_data(cls, rules, data):
+        """Rebuild a tree from the output of :meth:`to_data`.
+
+        This skips ranking, apavāda inference, and feature bucketing.
+
+        :param rules: the same list of rules used to create `data`
+        :param data: the output of :meth:`to_data`
+        """
+        features = {}
+        for rule in rules:
+            for feat in rule.features():
+                features[(feat[0].name, feat[1])] = feat
+
+        _link_apavadas((rules[i], set(rules[j] for j in values))
+                       for i, values in data['apavada'])
+        tree = cls._from_node_data(rules, features, data['tree'])
+        tree._set_ranked_rules([rules[i] for i in data['ranked']])
+        return tree
+
+    @classmethod
+    def _from_node_data(cls, rules, features, node):
+        rule_indices, children = node
+        tree = cls.__new__(cls)
+        tree.rules = [rules[i] for i in rule_indices]
+        tree.features = {}
+        for key, child in children:
+            subtree = cls._from_node_data(rules, features, child)
+            tree.features[features[key]] = subtree
+        return tree
+
+    def to_data(self, rules):
+        """Return a picklable description of this tree.
+
+        Rules, filters, and operators are defined with closures and
+        can't be pickled. Instead, rules are stored as indices into
+        `rules` and features are stored by filter name.
+
+        :param rules: the list of rules used to create the tree
+        """
+        index = dict((rule, i) for i, rule in enumerate(rules))
+
+        features = {}
+        for rule in rules:
+            for feat in rule.features():
+                key = (feat[0].name, feat[1])
+                if features.setdefault(key, feat) != feat:
+                    raise ValueError('Ambiguous feature: %r' % (key,))
+
+        apavada = [(index[r], sorted(index[a] for a in r.apavada))
+                   for r in rules if r.apavada]
+        return {
+            'ranked': [index[r] for r in self.ranked_rules],
+            'apavada': apavada,
+            'tree': self._node_data(index),
+        }
+
+    def _node_data(self, index):
+        children = [((filt.name, i), tree._node_data(index))
+                    for (filt, i), tree in self.features.iteritems()]
+        return ([index[r] for r in self.rules], children)
+
+    @classmethod
+    def load(cls, path, rules):
+        """Load a tree saved with :meth:`save`.
+
+        :param path: the path to the saved tree
+        :param rules: the list of rules used to create the tree
+        :returns: the tree, or ``None`` if the file is missing or out
+                  of date.
+        """
+        try:
+            with open(path, 'rb') as f:
+                version, digest, names, data = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            return None
+
+        if (version != DATA_VERSION or digest != source_digest()
+                or names != [r.name for r in rules]):
+            return None
+        return cls.from_data(rules, data)
+
+    def save(self, path, rules):
+        """Save this tree to `path`.
+
+        The file is tagged with :func:`source_digest`, so it's ignored
+        once any of the rule definitions change.
+
+        :param path: the destination path
+        :param rules: the list of rules used to create the tree
+        """
+        payload = (DATA_VERSION, source_digest(), [r.name for r in rules],
+                   self.to_data(rules))
+        with atomic_open(path) as f:
+            pickle.dump(payload, f, pickle.HIGHEST_PROTOCOL)
+
+    def _set_ranked_rules(self, ranked_rules):
+        #: All rules, from highest rank to lowest.
+        self.ranked_rules = ranked_rules
+        for i, rule in enumerate(ranked_rules):
+            rule.rank = i
+        #: The largest number of terms that a rule's filters examine.
+        self.width = max([len(r.filters) for r in ranked_rules] or [1])
+
     def __len__(self):
         """The number of rules in the tree."""
         self_len = len(self.rules)
@@ -107,15 +342,26 @@ class RuleTree(object):
     def candidates(self, state):
         """Generate all rule-index pairs that could apply to the state.
 
+        Pairs are yielded in rank order. For pairs with the same rule,
+        lower indices come first. Since the selection for each index is
+        already sorted by rank, the selections are merged lazily, and
+        the cost of finding the next rule depends only on the number of
+        rules selected.
+
         :param state: the current state
         """
-        state_indices = range(len(state))
-        candidates = [self.select(state, i) for i in state_indices]
+        streams = []
+        for ia in range(len(state)):
+            selection = self.select_cached(state, ia)
+            if selection:
+                streams.append(_ranked_pairs(selection, ia))
 
-        for i, ra in enumerate(self.ranked_rules):
-            for ia in state_indices:
-                if ra in candidates[ia]:
-                    yield ra, ia
+        if len(streams) == 1:
+            pairs = streams[0]
+        else:
+            pairs = heapq.merge(*streams)
+        for rank, ia, ra in pairs:
+            yield ra, ia
 
     def pprint(self, depth=0):
         """Pretty-print the tree."""
@@ -141,3 +387,80 @@ class RuleTree(object):
                 selection.update(tree.select(state, index))
 
         return selection
+
+    def select_cached(self, state, index):
+        """Like :meth:`select`, but reuse work from earlier states.
+
+        Most features are term filters, which look at just one term.
+        So the part of the selection that depends on term filters is a
+        function of just the terms in the rule window, i.e. the terms
+        from `index` to `index + self.width`. That part is cached on
+        the state's lineage and reused by any later state that has the
+        same terms in the same window. Filters don't look at a term's
+        `ops`, so adding an op doesn't count as a change.
+
+        :class:`~vyakarana.ashtadhyayi.Ashtadhyayi` gives all of its
+        starting states the same cache, so selections are also reused
+        across derivations.
+
+        The remaining features might look at any part of the state, so
+        they're evaluated every time.
+
+        Unlike :meth:`select`, this returns a tuple of rules sorted by
+        rank.
+
+        :param state: the current :class:`State`
+        :param index: the current index
+        """
+        window = state[index:index + self.width]
+        key = (self,) + tuple(t.fingerprint(ops=False) for t in window)
+        cache = state.selections
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache[key] = self._select_local(state, index)
+        rules, deferred = entry
+
+        if not deferred:
+            return rules
+
+        extra = set()
+        for (filt, i), tree in deferred:
+            j = index + i
+            if j >= 0 and filt.allows(state, j):
+                extra.update(tree.select(state, index))
+        if not extra:
+            return rules
+        return tuple(sorted(extra.union(rules), key=_by_rank))
+
+    def _select_local(self, state, index):
+        """Select rules using only term filters.
+
+        :param state: the current :class:`State`
+        :param index: the current index
+        :returns: a 2-tuple of the selected rules, sorted by rank, and
+                  a list of
+                  (feature, subtree) pairs that could not be checked
+                  with term filters.
+        """
+        selection = set()
+        deferred = []
+        self._collect_local(state, index, selection, deferred)
+        return tuple(sorted(selection, key=_by_rank)), deferred
+
+    def _collect_local(self, state, index, selection, deferred):
+        try:
+            term_features = self._term_features
+        except AttributeError:
+            term_features = self._term_features = []
+            self._other_features = []
+            for feature, tree in self.features.iteritems():
+                if isinstance(feature[0], TermFilter):
+                    term_features.append((feature, tree))
+                else:
+                    self._other_features.append((feature, tree))
+
+        selection.update(self.rules)
+        deferred.extend(self._other_features)
+        for (filt, i), tree in term_features:
+            if filt.allows(state, index + i):
+                tree._collect_local(state, index, selection, deferred)
@@ -8,7 +8,11 @@
     :license: MIT and BSD
 """
 
+import bisect
 import itertools
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
 
 
 def iter_group(items, n):
@@ -23,90 +27,300 @@ def iter_pairwise(items):
     return itertools.izip(x, y)
 
 
+@contextmanager
+def atomic_open(path):
+    """Open `path` for binary writing and replace it all at once.
+
+    The data is written to a temporary file that is renamed to `path`
+    on success, so other processes never see a partial file.
+
+    :param path: the destination path
+    """
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class BitRegistry(object):
+
+    """Assigns a distinct bit to each of a collection of values.
+
+    Values are registered in order. A value that hasn't been seen
+    before is given the next free bit as soon as it's used, so the
+    registry never needs to know every value up front.
+
+    :param values: the values to register immediately
+    """
+
+    def __init__(self, values=()):
+        #: Maps a value to its bit.
+        self.bits = {}
+        #: The registered values. The value at index ``i`` has the bit
+        #: ``1 << i``.
+        self.values = []
+        for value in values:
+            self.bit(value)
+
+    def __contains__(self, value):
+        return value in self.bits
+
+    def __len__(self):
+        return len(self.values)
+
+    def bit(self, value):
+        """Return the bit for `value`, registering it if necessary.
+
+        :param value: some hashable value
+        """
+        try:
+            return self.bits[value]
+        except KeyError:
+            bit = self.bits[value] = 1 << len(self.values)
+            self.values.append(value)
+            return bit
+
+    def decode(self, mask):
+        """Return the values whose bits are set in `mask`.
+
+        :param mask: an integer
+        """
+        return [v for i, v in enumerate(self.values) if mask >> i & 1]
+
+    def mask(self, values):
+        """Return the union of the bits for `values`.
+
+        :param values: an iterable of hashable values
+        """
+        bits = self.bits
+        mask = 0
+        for value in values:
+            try:
+                mask |= bits[value]
+            except KeyError:
+                mask |= self.bit(value)
+        return mask
+
+
+class LRUCache(object):
+
+    """A mapping with a bounded size and least-recently-used eviction.
+
+    The cache also counts its hits and misses, which makes it easy to
+    see whether it's worth keeping around.
+
+    :param max_size: the maximum number of items to store. If ``None``,
+                     the cache is unbounded.
+    """
+
+    def __init__(self, max_size=None):
+        #: The maximum number of items in the cache.
+        self.max_size = max_size
+        #: The number of successful lookups.
+        self.hits = 0
+        #: The number of unsuccessful lookups.
+        self.misses = 0
+        self.data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return '<LRUCache(%s/%s)>' % (len(self.data), self.max_size)
+
+    def __setitem__(self, key, value):
+        data = self.data
+        if key in data:
+            del data[key]
+        elif self.max_size is not None and len(data) >= self.max_size:
+            data.popitem(last=False)
+        data[key] = value
+
+    def clear(self):
+        """Remove all items and reset all counters."""
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value for `key`, or `default` if there isn't one.
+
+        :param key: some hashable key
+        :param default: the value to return on a miss
+        """
+        data = self.data
+        try:
+            value = data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        # Re-insert to mark `key` as the most recently used.
+        data[key] = value
+        self.hits += 1
+        return value
+
+    def stats(self):
+        """Return a `dict` of basic usage statistics."""
+        total = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / total if total else 0.0,
+        }
+
+
 class SoundEditor(object):
 
+    """Edits the sounds of a state as a single flat buffer.
+
+    The sounds of every term are stored in one list, along with the
+    position where each term starts. Iterating over the editor moves a
+    single :class:`SoundCursor` along the buffer, so nothing is
+    allocated per sound.
+
+    :param state: the state to edit
+    :param locus: the term value to read and write
+    """
+
     def __init__(self, state, locus='asiddha'):
         self.state = state
         self.locus = locus
-        self.data = [list(term.asiddha) for term in state]
 
-        self.indices = []
-        abs_index = 0
-        for i, term in enumerate(state):
-            for j, sound in enumerate(term.asiddha):
-                sound_index = SoundIndex(value=sound, term=term, state_index=i,
-                                         term_index=j, absolute_index=abs_index, editor=self)
-                self.indices.append(sound_index)
-                abs_index += 1
+        #: The sounds of every term, in order. A sound can be replaced
+        #: with any string, including ``''``.
+        self.data = data = []
+        #: The index in `data` where each term starts, followed by
+        #: ``len(data)``.
+        self.starts = starts = []
+        for term in state:
+            starts.append(len(data))
+            data.extend(term.get_at(locus))
+        starts.append(len(data))
 
     def __iter__(self):
-        for index in self.indices:
-            yield index
+        cursor = SoundCursor(self)
+        for i in xrange(len(self.data)):
+            cursor.index = i
+            yield cursor
+
+    def __len__(self):
+        return len(self.data)
 
     def join(self):
+        """Return a state with the edited values.
+
+        Only terms whose value changed are replaced.
+        """
         state = self.state
-        new_terms = []
-        for i, term in enumerate(state):
-            new_value = ''.join(L for L in self.data[i])
-            new_term = self.state[i].set_at(self.locus, new_value)
-            new_terms.append(new_term)
+        data = self.data
+        starts = self.starts
+        locus = self.locus
+        for i, term in enumerate(self.state):
+            new_value = ''.join(data[starts[i]:starts[i + 1]])
+            if new_value != term.get_at(locus):
+                state = state.swap(i, term.set_at(locus, new_value))
+        return state
 
-        return state.replace_all(new_terms)
+    def state_index(self, index):
+        """Return the index of the term that contains some sound, or
+        ``None`` if there's no such term.
 
-    def next(self, index):
-        try:
-            return self.indices[index.absolute_index + 1]
-        except (TypeError, IndexError):
-            return SoundIndex(editor=self)
+        :param index: an index into `data`
+        """
+        if 0 <= index < len(self.data):
+            return bisect.bisect_right(self.starts, index) - 1
+        return None
 
-    def prev(self, index):
-        try:
-            new_index = index.absolute_index - 1
-            if new_index >= 0:
-                return self.indices[new_index]
-        except TypeError:
-            pass
-        return SoundIndex(editor=self)
-
-
-class SoundIndex(object):
-
-    __slots__ = ['_value', 'term', 'state_index', 'term_index',
-                 'absolute_index', 'editor', 'first', 'last']
-
-    def __init__(self, value=None, term=None, state_index=None,
-                 term_index=None, absolute_index=None, editor=None):
-        #: The value associated with this index.
-        self._value = value
-        #: The term associated with this index.
-        self.term = term
-        #: The state index that corresponds to `self.term`.
-        self.state_index = state_index
-        #: The term index that corresponds to `self.value`.
-        self.term_index = term_index
-        #: The absolute index of this `SoundIndex` within the editor
-        self.absolute_index = absolute_index
-        #: The sound iterator that produced this index
+
+class SoundCursor(object):
+
+    """A position within a :class:`SoundEditor`.
+
+    A cursor outside of the buffer has the value ``None``.
+
+    :param editor: the editor that owns the cursor
+    :param index: the cursor's index in the editor's buffer
+    """
+
+    __slots__ = ['editor', 'index', '_prev', '_next']
+
+    def __init__(self, editor, index=None):
         self.editor = editor
+        self.index = index
+        self._prev = self._next = None
 
-        #: True iff this is the first letter in the term.
-        self.first = term_index == 0
-        #: True iff this is the last letter in the term.
-        self.last = term_index == len(term.value) - 1 if term else False
+    @property
+    def first(self):
+        """``True`` iff this is the first sound in its term."""
+        return self.term_index == 0
+
+    @property
+    def last(self):
+        """``True`` iff this is the last sound in its term."""
+        term = self.term
+        return term is not None and self.term_index == len(term.value) - 1
 
     @property
     def next(self):
-        return self.editor.next(self)
+        """A cursor for the next sound.
+
+        Each cursor reuses the same neighbor, so this allocates only
+        once per cursor.
+        """
+        cursor = self._next
+        if cursor is None:
+            cursor = self._next = SoundCursor(self.editor)
+        cursor.index = self.index + 1
+        return cursor
 
     @property
     def prev(self):
-        return self.editor.prev(self)
+        """A cursor for the previous sound. See :attr:`next`."""
+        cursor = self._prev
+        if cursor is None:
+            cursor = self._prev = SoundCursor(self.editor)
+        cursor.index = self.index - 1
+        return cursor
+
+    @property
+    def state_index(self):
+        """The index of the term that contains this sound."""
+        return self.editor.state_index(self.index)
+
+    @property
+    def term(self):
+        """The term that contains this sound, or ``None``."""
+        i = self.state_index
+        return None if i is None else self.editor.state[i]
+
+    @property
+    def term_index(self):
+        """The index of this sound within its term."""
+        i = self.state_index
+        return None if i is None else self.index - self.editor.starts[i]
 
     @property
     def value(self):
-        return self._value
+        data = self.editor.data
+        index = self.index
+        if 0 <= index < len(data):
+            return data[index]
+        return None
 
     @value.setter
     def value(self, new_value):
-        self._value = new_value
-        self.editor.data[self.state_index][self.term_index] = new_value
+        data = self.editor.data
+        index = self.index
+        if not 0 <= index < len(data):
+            raise IndexError(index)
+        data[index] = new_value